@@ -0,0 +1,883 @@
+"""
+Benchmarks the scraper on synthetic sourcebooks, so its performance can be measured
+without the real PDFs. The synthetic books use the same font names as the real ones
+(BiolinumOB headings, Avenir body text with Heavy and Oblique variants, RPGIcons
+glyphs) and come with matching Paper Blossoms json stubs.
+
+    python -m bench --output before.json
+    python -m bench --compare before.json
+"""
+from pypdf import PdfReader
+from typing import Any, Callable
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+import scrape
+import stream_extractor
+from reader_pool import map_pdf, hash_stream
+from text_items import TextItems
+
+FONTS = {
+    "Heading": "AAAAAA+LinBiolinumOB",
+    "Body": "AAAAAB+Avenir-Book",
+    "Heavy": "AAAAAC+Avenir-Heavy",
+    "Oblique": "AAAAAD+Avenir-BookOblique",
+    "Icons": "AAAAAE+RPGIcons",
+    }
+ICONS = ["\uf3b0", "\uf3b2", "\uf3b5", "\uf3b9", "\uf3ba"]
+WORDS = ["samurai", "clan", "honor", "glory", "status", "strife", "ring", "void", "fire", "water",
+         "air", "earth", "court", "duel", "blade", "scroll", "opportunity", "spend", "check", "target",
+         "character", "rank", "school", "technique", "kata", "shūji", "kihō", "bushidō", "emperor",
+         "ancestor", "spirit", "kami", "village", "castle", "retainer", "daimyō", "conflict", "action"]
+NAME_WORDS = ["Crane", "Lion", "Deer", "Dragon", "Phoenix", "Scorpion", "Unicorn", "Crab", "Mantis",
+              "Stone", "Wind", "River", "Silent", "Falling", "Iron", "Jade", "Crimson", "Hidden"]
+# Cleared by --no-memory
+measure_memory = True
+
+LINE_HEIGHT = 12
+PAGE_TOP = 740
+PAGE_BOTTOM = 60
+
+
+def write_pdf(path: str, pages: list[list[tuple[str, float, float, float, str]]], image_bytes: int = 0):
+    """
+    Writes a PDF with one content stream per page. Each page is a list of
+    (font, x, y, size, text) runs, where font is a key of FONTS. Characters are mapped
+    to single-byte codes through a ToUnicode CMap shared by every font. With image_bytes,
+    each page's resources also have an image of that many random bytes, standing in for
+    the art that makes up most of a real sourcebook, which the page doesn't draw.
+    """
+    codes = {chr(c): c for c in range(32, 127)}
+    for page in pages:
+        for run in page:
+            for c in run[4]:
+                if c not in codes:
+                    codes[c] = 128 + len(codes) - 95
+    cmap_lines = ["/CIDInit /ProcSet findresource begin", "12 dict begin", "begincmap",
+                  "/CMapName /Synthetic def", "1 begincodespacerange", "<00> <FF>", "endcodespacerange"]
+    mapping = sorted(codes.items(), key = lambda item: item[1])
+    for start in range(0, len(mapping), 100):
+        block = mapping[start:start + 100]
+        cmap_lines.append(f"{len(block)} beginbfchar")
+        cmap_lines += [f"<{code:02X}> <{ord(c):04X}>" for (c, code) in block]
+        cmap_lines.append("endbfchar")
+    cmap_lines += ["endcmap", "CMapName currentdict /CMap defineresource pop", "end", "end"]
+    cmap = "\n".join(cmap_lines).encode("ascii")
+
+    objects = []
+    def add(data: bytes) -> int:
+        objects.append(data)
+        return len(objects)
+    cmap_id = add(b"<< /Length %d >>\nstream\n" % len(cmap) + cmap + b"\nendstream")
+    widths = " ".join(["500"] * 256)
+    font_ids = {}
+    for (key, base_font) in FONTS.items():
+        font_ids[key] = add(f"<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} /FirstChar 0 "
+                            f"/LastChar 255 /Widths [{widths}] /ToUnicode {cmap_id} 0 R >>".encode("ascii"))
+    fonts = "/Font << " + " ".join(f"/{key} {font_id} 0 R" for (key, font_id) in font_ids.items()) + " >>"
+    pages_id = add(b"")
+    page_ids = []
+    rng = random.Random(len(pages))
+    for page in pages:
+        resources = f"<< {fonts} >>"
+        if image_bytes > 0:
+            image_id = add(b"<< /Type /XObject /Subtype /Image /Width %d /Height 1 /ColorSpace /DeviceGray "
+                           b"/BitsPerComponent 8 /Length %d >>\nstream\n" % (image_bytes, image_bytes)
+                           + rng.randbytes(image_bytes) + b"\nendstream")
+            resources = f"<< {fonts} /XObject << /Art {image_id} 0 R >> >>"
+        content = bytearray()
+        for (font, x, y, size, text) in page:
+            encoded = bytes(codes[c] for c in text)
+            encoded = encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+            content += b"BT /%s 1 Tf %g 0 0 %g %g %g Tm (%s) Tj ET\n" % (font.encode("ascii"), size, size, x, y, encoded)
+        compressed = zlib.compress(bytes(content))
+        content_id = add(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(compressed) + compressed + b"\nendstream")
+        page_ids.append(add(f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 612 792] "
+                            f"/Resources {resources} /Contents {content_id} 0 R >>".encode("ascii")))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[pages_id - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("ascii")
+    catalog_id = add(f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode("ascii"))
+
+    data = bytearray(b"%PDF-1.7\n")
+    offsets = []
+    for (i, obj) in enumerate(objects):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % (i + 1) + obj + b"\nendobj\n"
+    xref_offset = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        data += b"%010d 00000 n \n" % offset
+    data += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref_offset)
+    f = open(path, "wb")
+    f.write(data)
+    f.close()
+
+
+class PageWriter:
+    """Lays out runs of text top to bottom on synthetic pages."""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.pages = []
+        self.new_page()
+
+    def new_page(self):
+        self.pages.append([])
+        self.y = PAGE_TOP
+
+    def room(self, lines: int) -> bool:
+        return self.y - lines * LINE_HEIGHT >= PAGE_BOTTOM
+
+    def line(self, runs: list[tuple[str, str]], size: float = 9, x: float = 50):
+        if not self.room(1):
+            self.new_page()
+        for (font, text) in runs:
+            self.pages[-1].append((font, x, self.y, size, text))
+            x += len(text) * size * 0.5
+        self.y -= LINE_HEIGHT if size < 12 else 2 * LINE_HEIGHT
+
+    def sentence(self, words: int) -> str:
+        return " ".join(self.rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+    def paragraph(self, lines: int):
+        for _ in range(lines):
+            roll = self.rng.random()
+            text = self.sentence(self.rng.randint(6, 10))
+            if roll < 0.15:
+                (head, tail) = text.split(" ", 1)
+                self.line([("Body", head + " "), ("Oblique", tail)])
+            elif roll < 0.25:
+                (head, tail) = text.rsplit(" ", 1)
+                self.line([("Body", head + " "), ("Icons", self.rng.choice(ICONS)), ("Body", " " + tail)])
+            elif roll < 0.35:
+                self.line([("Body", text[:-1] + " wa-")])
+            else:
+                self.line([("Body", text)])
+
+
+def make_sourcebook(directory: str, num_pages: int, book: str = "CoS", title: str = "Courts of Stone",
+                    page_offset: int = 2, seed: int = 0, image_bytes: int = 0) -> dict[str, list]:
+    """
+    Writes a synthetic sourcebook of about num_pages pages to directory/<book>.pdf
+    and returns the json stubs for its entries, by json file name.
+    """
+    rng = random.Random(seed)
+    writer = PageWriter(rng)
+    # Front matter, with the title marker get_id looks for.
+    for _ in range(max(2, num_pages // 20)):
+        writer.line([("Heading", title)], size = 24)
+        writer.paragraph(20)
+        writer.new_page()
+    placed = []
+    used_names = set()
+    kinds = ["clan", "school", "distinction", "adversity", "technique", "technique", "technique"]
+    while len(writer.pages) < num_pages - 1:
+        kind = rng.choice(kinds)
+        name = f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {kind.title()}"
+        while name in used_names:
+            name += " " + rng.choice(NAME_WORDS)
+        used_names.add(name)
+        lines = rng.randint(4, 12)
+        if not writer.room(lines + 6):
+            writer.new_page()
+        page_num = len(writer.pages) - 1
+        writer.line([("Heading", name)], size = 14)
+        if kind in ["clan", "school"]:
+            for prop in ["Rings", "Starting Skills", "Honor"]:
+                writer.line([("Heavy", prop + ":"), ("Body", f" {rng.randint(1, 5)} {rng.choice(WORDS)}")])
+        writer.paragraph(lines)
+        if kind in ["distinction", "adversity"]:
+            for _ in range(rng.randint(2, 3)):
+                writer.line([("Body", "$ " + writer.sentence(rng.randint(5, 8)))])
+        if kind == "school":
+            writer.line([("Heavy", "ADVANCE TABLE")])
+        placed.append((kind, name, page_num - page_offset))
+    writer.new_page()
+    for (i, page) in enumerate(writer.pages):
+        if i - page_offset >= 0:
+            page.append(("Body", 300, 30, 6, str(i - page_offset)))
+    write_pdf(os.path.join(directory, f"{book}.pdf"), writer.pages, image_bytes)
+
+    stubs = {"clans": [], "schools": [], "techniques": [], "advantages_disadvantages": []}
+    distinctions = {"name": "Distinctions", "entries": []}
+    adversities = {"name": "Adversities", "entries": []}
+    techniques = {"name": "Kata", "subcategories": [{"name": "General Kata", "techniques": []}]}
+    for (kind, name, page) in placed:
+        stub = {"name": name, "reference": {"book": book, "page": page}}
+        if kind == "clan":
+            stub["families"] = []
+            stubs["clans"].append(stub)
+        elif kind == "school":
+            stubs["schools"].append(stub)
+        elif kind == "distinction":
+            distinctions["entries"].append(stub)
+        elif kind == "adversity":
+            adversities["entries"].append(stub)
+        else:
+            techniques["subcategories"][0]["techniques"].append(stub)
+    stubs["advantages_disadvantages"] = [distinctions, adversities]
+    stubs["techniques"] = [techniques]
+    return stubs
+
+def write_json_stubs(directory: str, stubs: dict[str, list]):
+    for (filename, dictList) in stubs.items():
+        f = open(os.path.join(directory, f"{filename}.json"), "w", encoding="utf-8")
+        f.write(json.dumps(dictList, ensure_ascii = False, indent = 1))
+        f.close()
+
+def count_entries(stubs: dict[str, list]) -> int:
+    return (len(stubs["clans"]) + len(stubs["schools"])
+            + sum(len(advList["entries"]) for advList in stubs["advantages_disadvantages"])
+            + sum(len(subCat["techniques"]) for techType in stubs["techniques"]
+                                            for subCat in techType["subcategories"]))
+
+
+def reference_condense_text(text_items, beginning_properties) -> list[tuple[str, str]]:
+    """The original condense_text, kept as the oracle for check_condense_text."""
+    condensed_items = []
+    current_font = ''
+    aggregate_text = ''
+    last_item = None
+    icon_text = ""
+    for i in range(0, len(text_items)):
+        end_text = ''
+        text_item = text_items[i]
+        if text_item[3] is None:
+            font = ''
+        else:
+            font = text_item[3]['/BaseFont']
+        if text_item[0].startswith('\n') or text_items[i-1][0].endswith('\n'):
+            new_line = True
+        else:
+            new_line = False
+        if len(text_item[0].strip()) == 0:
+            continue
+        if text_item[2][0] < 8 and 'Ornament' not in font and last_item is not None \
+           and last_item[3] is not None and 'Ornament' not in last_item[3]['/BaseFont']:
+            continue
+        if 'RPGIcons' in font:
+            icon_text += text_item[0] + " "
+        next_font = font
+        next_text = ""
+        if current_font != font:
+            if 'BiolinumOB' in font:
+                if 'Heading' != current_font:
+                    next_font = 'Heading'
+                    finish_item = True
+                else:
+                    finish_item = False
+            elif text_item[0].rstrip().endswith(":") and 'Heavy' in font:
+                next_font = 'PropertyName'
+                if len(icon_text) > 0:
+                    aggregate_text = aggregate_text[:-len(icon_text)]
+                    next_text = icon_text
+                    icon_text = ""
+                while aggregate_text.strip().endswith("*"):
+                    aggregate_text = aggregate_text.strip()[:-1]
+                    heavy_init = aggregate_text.rfind('*')
+                    next_text = aggregate_text[heavy_init+1:] + " " + next_text
+                    aggregate_text = aggregate_text[:heavy_init].strip()
+                finish_item = True
+            elif current_font == 'PropertyName':
+                next_font = 'PropertyValue'
+                finish_item = True
+            elif current_font == 'PropertyValue' and not new_line:
+                finish_item = False
+            elif current_font == 'PropertyValue' and not beginning_properties and 'Avenir' in font:
+                finish_item = False
+            elif 'Avenir' in font:
+                if 'Basic' != current_font:
+                    next_font = 'Basic'
+                    finish_item = True
+                else:
+                    finish_item = False
+            elif 'RPGIcons' in font:
+                finish_item = False
+            else:
+                finish_item = True
+            if finish_item:
+                if len(aggregate_text.strip()) > 0:
+                    condensed_items.append((reference_remove_redundancy(aggregate_text.strip()), current_font))
+                current_font = next_font
+                aggregate_text = next_text
+        if 'RPGIcons' not in font:
+            icon_text = ""
+        # Reproduce indentation
+        if (len(aggregate_text) > 0 
+             and text_item[2][4] - last_item[2][4] > 1
+             and text_item[2][5] - last_item[2][5] < -1 
+             and '$' not in aggregate_text):
+            aggregate_text = aggregate_text.strip() + "\n\t"
+        if current_font in ['Basic', 'PropertyValue']:
+            if 'Oblique' in font:
+                end_text = '/'
+            if 'Heavy' in font:
+                end_text += '*'
+            aggregate_text += end_text[::-1]
+            
+        # Recombine words with weird font changes in the middle.
+        if len(text_item[0]) == 1 and 'Avenir' in font:
+            if aggregate_text.endswith(" "):
+                aggregate_text = aggregate_text[:-1]
+            if aggregate_text.endswith("/ /"):
+                aggregate_text = aggregate_text[:-3]
+            if aggregate_text.endswith("* *"):
+                aggregate_text = aggregate_text[:-3]
+        # Remove hyphenation
+        if current_font == "PropertyName":
+            aggregate_text += text_item[0].strip().rstrip(":")
+        elif text_item[0][-1] == '-':
+            aggregate_text += text_item[0][:-1].strip()
+        elif text_item[0].endswith('-\n'):
+            aggregate_text += text_item[0][:-2].strip()
+        elif text_item[0][-1] == '\n':
+            aggregate_text += text_item[0].strip()
+            end_text += " "
+        elif text_item[0][-1] == ' ':
+            aggregate_text += text_item[0].strip()
+            end_text += " "
+        else:
+            aggregate_text += text_item[0]
+            end_text += " "
+        aggregate_text += end_text
+        last_item = text_item
+    return condensed_items
+
+def reference_remove_redundancy(text) -> str:
+    """The original remove_redundancy and the two functions below, kept for check_normalization."""
+    text = reference_eliminate_extra_space(text)
+    text = text.replace("/ /"," ")
+    text = text.replace("* *"," ")
+    text = text.replace("//","")
+    text = text.replace("**","")
+    return text
+
+def reference_eliminate_extra_space(text) -> str:
+    size = len(text)
+    text = text.replace("  "," ")
+    text = text.replace(" \n", "\n")
+    text = text.replace("\t\n", "\n")
+    text = text.replace(" .",".")
+    text = text.replace(" ,",",")
+    text = text.replace("( ","(")
+    text = text.replace(" )",")")
+    text = text.replace("] [","][")
+    text = text.replace("] :","]:")
+    if text.startswith(" ") or text.startswith("\n"):
+        text = text[1:]
+    if len(text) < size:
+        return reference_eliminate_extra_space(text)
+    else:
+        return text
+
+def reference_translate_icons(text) -> str:
+    text = text.replace('\uf3b0', "[Succ]")
+    text = text.replace('\uf3b2', "[Exp]")
+    text = text.replace('\uf3b5', "[RingDie]")
+    text = text.replace('\uf3b9', "[Kata]")
+    text = text.replace('\uf3ba', "[Shūji]")
+    text = text.replace('\uf3b7', "[Ritual]")
+    text = text.replace('\uf3bc', "[Invocation]")
+    text = text.replace('\uf3b8', "[Ninjutsu]")
+    text = text.replace('\uf3b8', "[Kihō]")
+    return text
+
+def random_text(rng: random.Random, length: int) -> str:
+    """Text full of the spacing, punctuation and icons the normalization functions deal with."""
+    pieces = ["a", "word", " ", " ", "  ", "   ", "\n", " \n", "\t", "\t\n", ".", ",", "(", ")", "( ",
+              " )", "[", "]", "] [", "] :", ":", "/", "/ /", "*", "* *", "\x00"] + list(scrape.ICON_NAMES)
+    return "".join(rng.choice(pieces) for _ in range(length))
+
+def check_normalization(random_cases: int = 20000) -> int:
+    """
+    Compares the normalization functions and their batch versions against the reference
+    implementations on random text. Returns the number of mismatches.
+    """
+    rng = random.Random(0)
+    mismatches = 0
+    def compare(name, expected, actual):
+        nonlocal mismatches
+        if actual != expected:
+            mismatches += 1
+            if mismatches <= 3:
+                print(f"{name} mismatch:\n  expected {expected!r}\n  actual   {actual!r}")
+    cases = 0
+    while cases < random_cases:
+        # Batches of one to eight texts; some contain the batch separator and take the slow path.
+        texts = [random_text(rng, rng.randint(0, 30)) for _ in range(rng.randint(1, 8))]
+        if rng.random() < 0.9:
+            texts = [text.replace("\x00", "") for text in texts]
+        cases += len(texts)
+        for text in texts:
+            compare("eliminate_extra_space", reference_eliminate_extra_space(text), scrape.eliminate_extra_space(text))
+            compare("remove_redundancy", reference_remove_redundancy(text), scrape.remove_redundancy(text))
+            compare("translate_icons", reference_translate_icons(text), scrape.translate_icons(text))
+        compare("remove_redundancy_batch", [reference_remove_redundancy(text) for text in texts],
+                scrape.remove_redundancy_batch(texts))
+        blurbs = [{"text": text} for text in texts] + [None]
+        scrape.normalize_blurbs(blurbs)
+        compare("normalize_blurbs", [reference_eliminate_extra_space(reference_translate_icons(text)) for text in texts],
+                [blurb["text"] for blurb in blurbs[:-1]])
+    print(f"normalization: {mismatches} mismatches in {cases} cases.")
+    return mismatches
+
+def random_text_items(rng: random.Random, count: int) -> list[list]:
+    """Visitor records with awkward text, fonts and positions, for check_condense_text."""
+    fonts = [None, "", "Times-Roman", "X+Ornament", "X+brushtip", "AAAAAF+Avenir-HeavyOblique"] + list(FONTS.values())
+    pieces = ["a", "word", "x y", " ", "  ", "\n", "\t", "-", "-\n", "$", "*", "* *", "/", "/ /",
+              ":", "Rings:", "(", ")", ".", ",", "[", "]"] + ICONS
+    text_items = []
+    (x, y) = (50.0, 700.0)
+    for _ in range(count):
+        text = "".join(rng.choice(pieces) for _ in range(rng.randint(1, 4)))
+        font = rng.choice(fonts)
+        x += rng.choice([-5, 0, 0.5, 3])
+        y += rng.choice([0, 0, -0.5, -12, 5])
+        scale = float(rng.choice([1, 6, 9, 9, 10]))
+        text_items.append([text, [1.0, 0.0, 0.0, 1.0, 0.0, 0.0], [scale, 0.0, 0.0, scale, x, y],
+                           None if font is None else {'/BaseFont': font}, 1.0])
+    return text_items
+
+def check_condense_text(num_pages: int = 80, random_cases: int = 2000) -> int:
+    """
+    Compares condense_text against reference_condense_text on the extractor records of
+    every page window of a synthetic book and on random text items, which condense_text
+    takes as TextItems. Returns the number of mismatches.
+    """
+    cases = []
+    with tempfile.TemporaryDirectory() as directory:
+        make_sourcebook(directory, num_pages)
+        reader = PdfReader(os.path.join(directory, "CoS.pdf"))
+        pages = [scrape.extract_page_records(reader, p) for p in range(len(reader.pages))]
+        cases += [pages[p] + pages[p + 1] for p in range(len(pages) - 1)]
+    rng = random.Random(0)
+    cases += [random_text_items(rng, rng.randint(0, 60)) for _ in range(random_cases)]
+    mismatches = 0
+    for text_items in cases:
+        for beginning_properties in [False, True]:
+            expected = reference_condense_text(text_items, beginning_properties)
+            actual = scrape.condense_text(TextItems.from_records(text_items),
+                                          beginning_properties)
+            if actual != expected:
+                mismatches += 1
+                if mismatches <= 3:
+                    print(f"condense_text mismatch:\n  expected {expected}\n  actual   {actual}")
+    print(f"condense_text: {mismatches} mismatches in {2 * len(cases)} cases.")
+    return mismatches
+
+def measure_text_items(pages: list[list[list]]) -> dict[str, dict[str, float]]:
+    """
+    Time and memory to load every page from the page cache's rows as lists of records,
+    the way find_text_items used to return them, and as TextItems. peak_bytes includes
+    json parsing; bytes_per_page is only what is kept of each page once it's loaded.
+    """
+    rows = [json.dumps(records, ensure_ascii = False) for records in pages]
+    def as_records() -> list[list[list]]:
+        return [[[text, cm, tm, None if font is None else {'/BaseFont': font}, size]
+                 for (text, cm, tm, font, size) in json.loads(page_rows)] for page_rows in rows]
+    def as_text_items() -> list[TextItems]:
+        return [TextItems.from_records(json.loads(page_rows)) for page_rows in rows]
+    results = {}
+    for (name, load) in [("text_items (records)", as_records), ("text_items (compact)", as_text_items)]:
+        results[name] = measure(load, 3)
+        results[name]["pages_per_second"] = len(pages) / results[name]["seconds"]
+        tracemalloc.start()
+        loaded = load()
+        results[name]["bytes_per_page"] = tracemalloc.get_traced_memory()[0] / len(pages)
+        tracemalloc.stop()
+        del loaded
+    return results
+
+def check_extractors(num_pages: int = 80, pdfs: list[str] = []) -> int:
+    """
+    Compares the records the stream extractor gives for every page of a synthetic book,
+    and of any other PDFs given, against pypdf's. Returns the number of mismatched pages.
+    """
+    def base_fonts(records: list[list]) -> list[list]:
+        return [[text, cm, tm, None if font is None else font.get('/BaseFont', ''), size]
+                for (text, cm, tm, font, size) in records]
+    mismatches = 0
+    pages = 0
+    fallback_pages = stream_extractor.fallback_pages
+    with tempfile.TemporaryDirectory() as directory:
+        make_sourcebook(directory, num_pages)
+        for path in [os.path.join(directory, "CoS.pdf")] + pdfs:
+            (pypdf_reader, stream_reader) = (PdfReader(path), PdfReader(path))
+            for page_num in range(len(pypdf_reader.pages)):
+                expected = base_fonts(stream_extractor.extract_records_with_pypdf(pypdf_reader.pages[page_num]))
+                actual = base_fonts(stream_extractor.extract_records(stream_reader, page_num))
+                pages += 1
+                if actual != expected:
+                    mismatches += 1
+                    if mismatches <= 3:
+                        print(f"extractor mismatch on page {page_num} of {path}:\n"
+                              f"  expected {expected[:5]}\n  actual   {actual[:5]}")
+    print(f"stream extractor: {mismatches} mismatches in {pages} pages, "
+          f"{stream_extractor.fallback_pages - fallback_pages} extracted by pypdf instead.")
+    return mismatches
+
+def check_fixture_replay(num_pages: int = 80, fixture_path: str | None = None) -> int:
+    """
+    Records the page windows and blurbs of every technique and advantage of a synthetic
+    book as a fixture, and checks that get_blurb gives the same blurbs replaying it, then
+    checks the recorded blurbs of the fixture at fixture_path if one is given. Returns the
+    number of blurbs that differ.
+    """
+    previous_dir = os.getcwd()
+    if fixture_path is not None:
+        fixture_path = os.path.abspath(fixture_path)
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            write_json_stubs(".", make_sourcebook(".", num_pages))
+            with contextlib.redirect_stdout(io.StringIO()):
+                pdfs = scrape.find_pdfs()
+                entries = list(scrape.get_technique_entries(pdfs)) + list(scrape.get_adv_disadv_entries(pdfs))
+                scrape.record_fixture("CoS.fixture.json.gz", "CoS.pdf", "CoS", cases = [
+                    (entry["name"], entry["itemType"], entry["page"], entry["options"]) for entry in entries])
+            fixture = scrape.load_fixture("CoS.fixture.json.gz")
+            mismatches = scrape.check_fixture(fixture, verbose = True)
+            print(f"fixture replay: {mismatches} mismatches in {len(fixture.cases)} blurbs.")
+        finally:
+            os.chdir(previous_dir)
+    if fixture_path is not None:
+        fixture = scrape.load_fixture(fixture_path)
+        golden_mismatches = scrape.check_fixture(fixture, verbose = True)
+        print(f"{fixture_path}: {golden_mismatches} of {len(fixture.cases)} recorded blurbs differ.")
+        mismatches += golden_mismatches
+    return mismatches
+
+
+# Commands that only read the json files or the blurb index, so shouldn't import pypdf
+STARTUP_COMMANDS = [["--help"], ["validate"], ["lookup", "--help"]]
+# How much longer than a bare interpreter each of them may take to start
+STARTUP_BUDGET_SECONDS = 0.1
+
+def check_startup(repeat: int = 5) -> int:
+    """
+    Runs each of STARTUP_COMMANDS in a fresh interpreter and checks that it doesn't
+    import pypdf and starts within the budget. Returns the number of commands that don't.
+    """
+    env = dict(os.environ, PYTHONPATH = os.path.dirname(os.path.abspath(__file__)))
+    def best_time(args: list[str], directory: str) -> float:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + args, cwd = directory, env = env, capture_output = True)
+            times.append(time.perf_counter() - start)
+        return min(times)
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        write_json_stubs(directory, make_sourcebook(directory, 40))
+        bare_time = best_time(["-c", "pass"], directory)
+        for command in STARTUP_COMMANDS:
+            result = subprocess.run([sys.executable, "-X", "importtime", "-m", "scrape"] + command, cwd = directory,
+                                    env = env, capture_output = True, text = True)
+            imported = [line.rsplit("|", 1)[-1].strip() for line in result.stderr.splitlines()
+                        if line.startswith("import time:")]
+            overhead = best_time(["-m", "scrape"] + command, directory) - bare_time
+            problems = []
+            if result.returncode != 0:
+                problems.append(f"exited with {result.returncode}")
+            if "pypdf" in imported:
+                problems.append("imported pypdf")
+            if overhead > STARTUP_BUDGET_SECONDS:
+                problems.append(f"over the {STARTUP_BUDGET_SECONDS * 1000:.0f} ms budget")
+            failures += len(problems) > 0
+            print(f"scrape {' '.join(command)}: {overhead * 1000:.0f} ms over a bare interpreter"
+                  + ("" if len(problems) == 0 else "; " + ", ".join(problems)) + ".")
+    return failures
+
+
+def reset_state():
+    """Forgets everything a previous run left behind, so each measurement starts cold."""
+    scrape.readers.clear()
+    for path in [scrape.BOOK_REGISTRY_PATH, scrape.MANIFEST_PATH] + list(scrape.OUTPUT_PATHS.values()):
+        if os.path.isfile(path):
+            os.remove(path)
+
+def measure(function: Callable[[], Any], repeat: int) -> dict[str, float]:
+    """
+    Best wall time over repeat runs, then peak traced memory of one more run.
+    Tracing is slow, so it's left out of the timed runs.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        reset_state()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        best = min(best, time.perf_counter() - start)
+    peak = 0
+    if measure_memory:
+        reset_state()
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak}
+
+def bench_book(num_pages: int, repeat: int) -> dict[str, dict[str, float]]:
+    results = {}
+    stubs = make_sourcebook(".", num_pages)
+    write_json_stubs(".", stubs)
+    num_entries = count_entries(stubs)
+    reader = PdfReader("CoS.pdf")
+    total_pages = len(reader.pages)
+
+    results["find_pdfs"] = measure(scrape.find_pdfs, repeat)
+    results["find_pdfs"]["pages_per_second"] = total_pages / results["find_pdfs"]["seconds"]
+
+    results["determine_page_offset"] = measure(lambda: scrape.determine_page_offset(PdfReader("CoS.pdf")), repeat)
+
+    # Text extraction of every page with each extractor, from a newly opened PDF each time
+    for extractor in scrape.TEXT_EXTRACTORS:
+        def extract_every_page():
+            book = PdfReader("CoS.pdf")
+            for page_num in range(total_pages):
+                scrape.extract_page_records(book, page_num)
+        scrape.set_text_extractor(extractor)
+        results[f"extract_text ({extractor})"] = measure(extract_every_page, repeat)
+        results[f"extract_text ({extractor})"]["pages_per_second"] = \
+            total_pages / results[f"extract_text ({extractor})"]["seconds"]
+    scrape.set_text_extractor("pypdf")
+
+    # Memory of the extracted pages, from the records the page cache would hold of them
+    results.update(measure_text_items([[[text, cm, tm, None if font is None else font.get('/BaseFont', ''), size]
+                                         for (text, cm, tm, font, size) in scrape.extract_page_records(reader, p)]
+                                        for p in range(total_pages)]))
+
+    windows = [scrape.find_text_items(reader, [p, p + 1]) for p in range(total_pages - 1)]
+    results["condense_text"] = measure(lambda: [scrape.condense_text(items, False) for items in windows], repeat)
+    results["condense_text"]["pages_per_second"] = len(windows) / results["condense_text"]["seconds"]
+
+    # Micro-benchmarks of the normalization stage, on the raw text of each page window
+    texts = ["".join(items.texts) for items in windows]
+    results["normalize (reference)"] = measure(
+        lambda: [reference_eliminate_extra_space(reference_translate_icons(text)) for text in texts], repeat)
+    results["normalize"] = measure(
+        lambda: [scrape.eliminate_extra_space(scrape.translate_icons(text)) for text in texts], repeat)
+    results["normalize_blurbs"] = measure(lambda: scrape.normalize_blurbs([{"text": text} for text in texts]), repeat)
+    # and on the items of each window, which condense_text normalizes a window at a time
+    item_texts = [[text for (text, font) in scrape.condense_text(items, False)] for items in windows]
+    results["remove_redundancy (reference)"] = measure(
+        lambda: [[reference_remove_redundancy(text) for text in window_texts] for window_texts in item_texts], repeat)
+    results["remove_redundancy_batch"] = measure(
+        lambda: [scrape.remove_redundancy_batch(window_texts) for window_texts in item_texts], repeat)
+    for name in ["normalize (reference)", "normalize", "normalize_blurbs",
+                 "remove_redundancy (reference)", "remove_redundancy_batch"]:
+        results[name]["pages_per_second"] = len(windows) / results[name]["seconds"]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        pdfs = scrape.find_pdfs()
+    entries = list(scrape.get_technique_entries(pdfs)) + list(scrape.get_adv_disadv_entries(pdfs))
+    def get_each_blurb():
+        for entry in entries:
+            scrape.get_blurb(entry["name"], entry["search_name"], entry["itemType"], entry["page"],
+                             entry["book"], reader, **entry["options"])
+    results["get_blurb"] = measure(get_each_blurb, repeat)
+    results["get_blurb"]["entries_per_second"] = len(entries) / results["get_blurb"]["seconds"]
+
+    results["make_user_description_file"] = measure(scrape.make_user_description_file, repeat)
+    results["make_user_description_file"]["pages_per_second"] = \
+        total_pages / results["make_user_description_file"]["seconds"]
+    results["make_user_description_file"]["entries_per_second"] = \
+        num_entries / results["make_user_description_file"]["seconds"]
+    return results
+
+def bench_fixture(path: str, repeat: int) -> dict[str, dict[str, float]]:
+    """
+    Times the condense and match stages on their own, on the page windows and blurbs
+    recorded in a fixture: condense_text of each case's window, then find_heading and
+    find_blurb on the condensed window.
+    """
+    results = {}
+    fixture = scrape.load_fixture(path)
+    cases = fixture.cases
+    windows = []
+    for case in cases:
+        reader = fixture.readers[case["book"]]
+        windows.append(scrape.find_text_items(reader, scrape.page_window(case["page"], len(reader.pages))))
+    def condense_each_window() -> list[list[tuple[str, str]]]:
+        return [scrape.condense_text(items, case["options"].get("beginning_properties", False))
+                for (items, case) in zip(windows, cases)]
+    results["condense_text"] = measure(condense_each_window, repeat)
+    results["condense_text"]["pages_per_second"] = \
+        sum(len(scrape.page_window(case["page"], len(fixture.readers[case["book"]].pages))) for case in cases) \
+        / results["condense_text"]["seconds"]
+    condensed_windows = condense_each_window()
+    results["find_heading"] = measure(lambda: [scrape.find_heading(condensed_items, case["name"])
+                                               for (condensed_items, case) in zip(condensed_windows, cases)], repeat)
+    results["find_blurb"] = measure(lambda: [scrape.find_blurb(condensed_items, case["name"], case["name"],
+                                                               case["itemType"], case["page"], case["book"],
+                                                               **case["options"])
+                                             for (condensed_items, case) in zip(condensed_windows, cases)], repeat)
+    for name in ["condense_text", "find_heading", "find_blurb"]:
+        results[name]["entries_per_second"] = len(cases) / results[name]["seconds"]
+    return results
+
+def run_benchmarks(sizes: list[int], repeat: int) -> dict[str, Any]:
+    report = {"commit": get_commit(), "sizes": {}}
+    previous_dir = os.getcwd()
+    # The page cache would turn every measurement after the first into a cache benchmark.
+    cache = scrape.page_cache
+    scrape.page_cache = None
+    try:
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as directory:
+                os.chdir(directory)
+                report["sizes"][str(size)] = bench_book(size, repeat)
+                os.chdir(previous_dir)
+    finally:
+        os.chdir(previous_dir)
+        scrape.page_cache = cache
+    return report
+
+def memory_status() -> dict[str, int]:
+    """
+    This process's memory from /proc/self/smaps_rollup, in bytes: resident (Rss), and
+    proportional (Pss), which only counts a share of pages mapped more than once, by
+    this or other processes. Pss_Anon is the process's own memory, and Pss_File its
+    share of the mapped files' pages.
+    """
+    status = {}
+    f = open("/proc/self/smaps_rollup", "r")
+    for line in f:
+        (key, _, value) = line.partition(":")
+        if key in ["Rss", "Pss", "Pss_Anon", "Pss_File"]:
+            status[key] = int(value.split()[0]) * 1024
+    f.close()
+    return status
+
+def measure_pdf_input(num_pages: int = 320, megabytes: int = 256, num_readers: int = 4) -> dict[str, dict[str, int]]:
+    """
+    Memory of a fresh process that opens num_readers readers of a synthetic book of about
+    megabytes, then hashes it and extracts every page with each. The readers either read
+    the PDF into memory, as pypdf does given its path, or map it with map_pdf.
+    Needs /proc, so Linux only.
+    """
+    results = {}
+    env = dict(os.environ, PYTHONPATH = os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as directory:
+        make_sourcebook(directory, num_pages, image_bytes = megabytes * 1024 * 1024 // num_pages)
+        path = os.path.join(directory, "CoS.pdf")
+        for pdf_input in ["read", "mmap"]:
+            result = subprocess.run([sys.executable, "-c", "import bench; bench.print_pdf_input_memory"
+                                     f"({path!r}, {pdf_input!r}, {num_readers})"],
+                                    env = env, capture_output = True, text = True, check = True)
+            results[pdf_input] = json.loads(result.stdout)
+        results["pdf_bytes"] = os.path.getsize(path)
+    return results
+
+def print_pdf_input_memory(path: str, pdf_input: str, num_readers: int):
+    """Run by measure_pdf_input in a fresh process: reads the PDF and prints memory_status as JSON."""
+    scrape.set_text_extractor("stream")
+    readers = []
+    for _ in range(num_readers):
+        reader = PdfReader(path if pdf_input == "read" else map_pdf(path))
+        hash_stream(reader.stream)
+        for page_num in range(len(reader.pages)):
+            scrape.extract_page_records(reader, page_num)
+        readers.append(reader)
+    print(json.dumps(memory_status()))
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True, text = True,
+                              cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+def print_report(report: dict[str, Any], baseline: dict[str, Any] | None = None):
+    print(f"{'benchmark':<30} {'pages':>6} {'seconds':>9} {'pages/s':>9} {'entries/s':>10} {'peak MB':>8}"
+          + (f" {'vs ' + baseline['commit']:>12}" if baseline is not None else ""))
+    for (size, results) in report["sizes"].items():
+        for (name, result) in results.items():
+            line = (f"{name:<30} {size:>6} {result['seconds']:>9.4f} "
+                    f"{result.get('pages_per_second', 0):>9.1f} {result.get('entries_per_second', 0):>10.1f} "
+                    f"{result['peak_bytes'] / (1024 * 1024):>8.2f}")
+            if baseline is not None:
+                old = baseline["sizes"].get(size, {}).get(name)
+                if old is not None:
+                    line += f" {old['seconds'] / result['seconds']:>11.2f}x"
+            print(line)
+        if "text_items (compact)" in results:
+            (old, new) = (results["text_items (records)"]["bytes_per_page"],
+                          results["text_items (compact)"]["bytes_per_page"])
+            print(f"{'text items per page':<30} {size:>6} {old / 1024:.1f} KB as records, "
+                  f"{new / 1024:.1f} KB as TextItems ({1 - new / old:.0%} less)")
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the scraper on synthetic sourcebooks.")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [40, 160, 320],
+                        help = "book sizes to benchmark, in pages")
+    parser.add_argument("--repeat", type = int, default = 3, help = "runs per measurement; the best is kept")
+    parser.add_argument("--no-memory", action = "store_true",
+                        help = "skip the (slow) peak memory measurements")
+    parser.add_argument("--check", action = "store_true",
+                        help = "check the optimized code against the reference implementations, "
+                               "and the startup time of the commands that don't read PDFs, instead")
+    parser.add_argument("--pdfs", nargs = "+", default = [], metavar = "PDF",
+                        help = "with --check, also compare the text extractors on these PDFs")
+    parser.add_argument("--fixture", help = "time condensing and heading matching on the blurbs of a fixture "
+                                            "made by scrape record-fixture instead, or with --check, check them")
+    parser.add_argument("--pdf-input", nargs = "?", type = int, const = 256, metavar = "MB",
+                        help = "compare the memory of reading a synthetic PDF of MB megabytes (default 256) "
+                               "into memory, four readers at a time, against memory mapping it, instead")
+    parser.add_argument("--output", help = "write the results to this JSON file")
+    parser.add_argument("--compare", help = "show speedups against results written by an earlier --output")
+    args = parser.parse_args(argv)
+    if args.check:
+        sys.exit(1 if check_condense_text() + check_normalization() + check_extractors(pdfs = args.pdfs)
+                      + check_fixture_replay(fixture_path = args.fixture) + check_startup() > 0 else 0)
+    if args.pdf_input is not None:
+        results = measure_pdf_input(megabytes = args.pdf_input)
+        print(f"4 readers of a {results['pdf_bytes'] / (1024 * 1024):.0f} MB PDF, hashed and extracted in full:")
+        print(f"{'PDF input':<10} {'RSS MB':>8} {'PSS MB':>8} {'own MB':>8} {'file MB':>8}")
+        for pdf_input in ["read", "mmap"]:
+            status = results[pdf_input]
+            print(f"{pdf_input:<10} " + " ".join(f"{status[key] / (1024 * 1024):>8.1f}"
+                                               for key in ["Rss", "Pss", "Pss_Anon", "Pss_File"]))
+        return
+    global measure_memory
+    measure_memory = not args.no_memory
+    if args.fixture is not None:
+        fixture_path = os.path.abspath(args.fixture)
+        previous_dir = os.getcwd()
+        # measure starts each run by removing the output files of the working directory.
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                results = bench_fixture(fixture_path, args.repeat)
+            finally:
+                os.chdir(previous_dir)
+        num_pages = sum(len(reader.page_items) for reader in scrape.load_fixture(fixture_path).readers.values())
+        report = {"commit": get_commit(), "sizes": {str(num_pages): results}}
+    else:
+        report = run_benchmarks(args.sizes, args.repeat)
+    baseline = None
+    if args.compare is not None:
+        f = open(args.compare, "r", encoding="utf-8")
+        baseline = json.loads(f.read())
+        f.close()
+    print_report(report, baseline)
+    if args.output is not None:
+        f = open(args.output, "w", encoding="utf-8")
+        f.write(json.dumps(report, indent = 4))
+        f.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+DEFAULT_INDEX_PATH = "blurbs.sqlite"
+INDEX_FORMAT_VERSION = 1
+
+
+class BlurbIndex:
+    """
+    SQLite database of scraped blurbs with a full-text index of their names and text,
+    for looking entries up without the PDFs. Blurbs are stored by fingerprint and
+    updated a book at a time, so only the entries that changed are written.
+    Doesn't import pypdf, so lookups start quickly.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != str(INDEX_FORMAT_VERSION):
+            self.db.executescript("DROP TABLE IF EXISTS blurbs; DROP TABLE IF EXISTS blurbs_fts;")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(INDEX_FORMAT_VERSION),))
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS blurbs (
+                fingerprint TEXT PRIMARY KEY, name TEXT COLLATE NOCASE, itemType TEXT,
+                text TEXT, book TEXT, page INTEGER);
+            CREATE INDEX IF NOT EXISTS blurbs_name ON blurbs (name);
+            CREATE INDEX IF NOT EXISTS blurbs_book ON blurbs (book);
+            CREATE VIRTUAL TABLE IF NOT EXISTS blurbs_fts USING fts5(
+                name, text, content = 'blurbs', content_rowid = 'rowid');
+            CREATE TRIGGER IF NOT EXISTS blurbs_insert AFTER INSERT ON blurbs BEGIN
+                INSERT INTO blurbs_fts (rowid, name, text) VALUES (new.rowid, new.name, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS blurbs_delete AFTER DELETE ON blurbs BEGIN
+                INSERT INTO blurbs_fts (blurbs_fts, rowid, name, text)
+                VALUES ('delete', old.rowid, old.name, old.text);
+            END;
+            """)
+        self.db.commit()
+
+    def update_book(self, book: str, blurbs: dict[str, dict]) -> tuple[int, int]:
+        """
+        Makes the book's blurbs in the index those given, by fingerprint.
+        Returns how many were added and removed.
+        """
+        indexed = set(row[0] for row in self.db.execute("SELECT fingerprint FROM blurbs WHERE book = ?", (book,)))
+        removed = indexed - blurbs.keys()
+        added = [fingerprint for fingerprint in blurbs if fingerprint not in indexed]
+        self.db.executemany("DELETE FROM blurbs WHERE fingerprint = ?", [(fingerprint,) for fingerprint in removed])
+        self.db.executemany("INSERT INTO blurbs VALUES (?, ?, ?, ?, ?, ?)",
+                            [(fingerprint, blurbs[fingerprint]["name"], blurbs[fingerprint]["itemType"],
+                              blurbs[fingerprint]["text"], book, blurbs[fingerprint]["page"])
+                             for fingerprint in added])
+        self.db.commit()
+        return (len(added), len(removed))
+
+    def remove_other_books(self, books: set[str]) -> int:
+        """Drops the blurbs of every book not in books, returning how many there were."""
+        others = [row[0] for row in self.db.execute("SELECT DISTINCT book FROM blurbs") if row[0] not in books]
+        removed = 0
+        for book in others:
+            removed += self.db.execute("DELETE FROM blurbs WHERE book = ?", (book,)).rowcount
+        self.db.commit()
+        return removed
+
+    def find(self, name: str, prefix: bool = False, itemType: str | None = None,
+             book: str | None = None, limit: int = 20) -> list[dict]:
+        """Blurbs by name, ignoring case, or by the start of their name with prefix."""
+        if prefix:
+            pattern = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            (condition, value) = ("blurbs.name LIKE ? ESCAPE '\\'", pattern)
+        else:
+            (condition, value) = ("blurbs.name = ?", name)
+        return self.select("blurbs", condition, value, itemType, book, "blurbs.name", limit)
+
+    def search(self, query: str, itemType: str | None = None, book: str | None = None,
+               limit: int = 20) -> list[dict]:
+        """Blurbs matching an FTS5 query on their name and text, best matches first."""
+        return self.select("blurbs_fts JOIN blurbs ON blurbs.rowid = blurbs_fts.rowid", "blurbs_fts MATCH ?",
+                           query, itemType, book, "blurbs_fts.rank", limit)
+
+    def select(self, source: str, condition: str, value: str, itemType: str | None, book: str | None,
+               order: str, limit: int) -> list[dict]:
+        values = [value]
+        if itemType is not None:
+            condition += " AND blurbs.itemType = ?"
+            values.append(itemType)
+        if book is not None:
+            condition += " AND blurbs.book = ?"
+            values.append(book)
+        rows = self.db.execute(f"SELECT blurbs.name, blurbs.itemType, blurbs.text, blurbs.book, blurbs.page "
+                               f"FROM {source} WHERE {condition} ORDER BY {order} LIMIT ?", values + [limit])
+        return [dict(row) for row in rows]
+
+    def close(self) -> None:
+        self.db.close()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description = "Query the blurb index written by scrape.py --index.")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    lookup = commands.add_parser("lookup", help = "print the blurbs of entries by name or by their text")
+    lookup.add_argument("query", help = "entry name, name prefix with --prefix, or FTS5 query with --search")
+    mode = lookup.add_mutually_exclusive_group()
+    mode.add_argument("--prefix", action = "store_true", help = "find entries whose name starts with the query")
+    mode.add_argument("--search", action = "store_true", help = "full-text search of names and text")
+    lookup.add_argument("--type", dest = "itemType", help = "only entries of this item type, e.g. technique")
+    lookup.add_argument("--book", help = "only entries from this book, e.g. CoS")
+    lookup.add_argument("--limit", type = int, default = 20)
+    lookup.add_argument("--json", action = "store_true", help = "print the blurbs as JSON lines")
+    lookup.add_argument("--index", default = DEFAULT_INDEX_PATH, help = "path of the blurb index")
+    args = parser.parse_args(argv)
+    if not os.path.isfile(args.index):
+        print(f"No blurb index at {args.index}; make one with python -m scrape --index.", file = sys.stderr)
+        return 2
+    index = BlurbIndex(args.index)
+    try:
+        if args.search:
+            blurbs = index.search(args.query, args.itemType, args.book, args.limit)
+        else:
+            blurbs = index.find(args.query, args.prefix, args.itemType, args.book, args.limit)
+    except sqlite3.OperationalError as e:
+        # Malformed FTS5 queries end up here.
+        print(f"Invalid search {args.query!r}: {e}", file = sys.stderr)
+        return 2
+    finally:
+        index.close()
+    for blurb in blurbs:
+        if args.json:
+            print(json.dumps(blurb, ensure_ascii = False))
+        else:
+            print(f"{blurb['name']} ({blurb['itemType']}, {blurb['book']} p. {blurb['page']})\n{blurb['text']}\n")
+    if len(blurbs) == 0:
+        print(f"No entries found for {args.query!r}.", file = sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
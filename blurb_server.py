@@ -0,0 +1,271 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from urllib.parse import parse_qsl, urlsplit
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import time
+
+import scrape
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Condensed page windows kept for later requests
+DEFAULT_MAX_WINDOWS = 512
+# Upper bounds of the latency histogram's buckets, in milliseconds
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                500: "Internal Server Error"}
+
+
+class LatencyHistogram:
+    """Counts of request latencies by bucket, with percentiles estimated from the buckets."""
+
+    def __init__(self, buckets_ms: list[float] = LATENCY_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        # The last count is for requests slower than every bucket.
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, latency_ms: float):
+        self.counts[bisect.bisect_left(self.buckets_ms, latency_ms)] += 1
+        self.total_ms += latency_ms
+        self.max_ms = max(self.max_ms, latency_ms)
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket the given fraction of requests fall within."""
+        count = sum(self.counts)
+        seen = 0
+        for (i, bucket_count) in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= fraction * count and seen > 0:
+                return self.buckets_ms[i] if i < len(self.buckets_ms) else self.max_ms
+        return 0.0
+
+    def report(self) -> dict[str, Any]:
+        count = sum(self.counts)
+        labels = [f"<={bound}ms" for bound in self.buckets_ms] + [f">{self.buckets_ms[-1]}ms"]
+        return {"requests": count, "mean_ms": self.total_ms / count if count > 0 else 0.0,
+                "max_ms": self.max_ms, "p50_ms": self.percentile(0.5), "p90_ms": self.percentile(0.9),
+                "p99_ms": self.percentile(0.99), "buckets": dict(zip(labels, self.counts))}
+
+
+class BlurbServer:
+    """
+    Answers blurb requests over HTTP from books identified once at startup. Requests
+    give an entry's name and, optionally, its item type, book and printed page; without
+    a book and page the entry is taken from the json files. Requests for entries on the
+    same page window wait for a single extraction and condensing of the window, and
+    condensed windows are kept for later requests. All PDF work happens on the executor's
+    single thread, since neither PdfReaders nor the page cache can be shared between threads.
+    """
+
+    def __init__(self, pdfs: dict[str, dict[str, Any]], entries: list[dict[str, Any]],
+                 executor: ThreadPoolExecutor, max_windows: int = DEFAULT_MAX_WINDOWS):
+        self.pdfs = pdfs
+        self.entries_by_name = {}
+        # Options like cut_to_list that go with each item type, for requests that give a page
+        self.options_by_type = {}
+        for entry in entries:
+            self.entries_by_name.setdefault(entry["name"].lower(), []).append(entry)
+            self.options_by_type.setdefault(entry["itemType"], entry["options"])
+        self.max_windows = max_windows
+        self.windows = OrderedDict()
+        self.pending_windows = {}
+        self.executor = executor
+        self.latencies = LatencyHistogram()
+        self.windows_condensed = 0
+
+    def find_entry(self, params: dict[str, str]) -> dict[str, Any] | None:
+        name = params["name"]
+        itemType = params.get("itemType")
+        if "book" in params and "page" in params:
+            jsonEntry = {"name": name, "reference": {"book": params["book"], "page": int(params["page"])}}
+            return scrape.make_entry(jsonEntry, itemType or "entry", self.pdfs,
+                                     **self.options_by_type.get(itemType, {}))
+        for entry in self.entries_by_name.get(name.lower(), []):
+            if (itemType is None or entry["itemType"] == itemType) \
+                    and params.get("book", entry["book"]) == entry["book"]:
+                return entry
+        return None
+
+    async def get_blurb(self, entry: dict[str, Any]) -> dict | None:
+        condensed_items = await self.get_condensed_window(entry)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: scrape.find_blurb(
+            condensed_items, entry["name"], entry["search_name"], entry["itemType"], entry["page"],
+            entry["book"], path = entry["path"], **entry["options"]))
+
+    async def get_condensed_window(self, entry: dict[str, Any]) -> list[tuple[str, str]]:
+        """
+        The entry's condensed page window, taking in the following pages one at a time for
+        as long as its blurb carries on to the end of the window, as in scrape.condense_entry_window.
+        """
+        loop = asyncio.get_running_loop()
+        num_pages = scrape.WINDOW_PAGES
+        while True:
+            condensed_items = await self.get_shared_window(entry, num_pages)
+            # Most windows can't take in more pages, which needs no trip to the executor to tell.
+            if num_pages >= scrape.max_blurb_pages:
+                return condensed_items
+            if not await loop.run_in_executor(self.executor, scrape.window_carries_on, condensed_items,
+                                              entry, num_pages):
+                return condensed_items
+            num_pages += 1
+
+    async def get_shared_window(self, entry: dict[str, Any], num_pages: int) -> list[tuple[str, str]]:
+        beginning_properties = entry["options"].get("beginning_properties", False)
+        key = (entry["path"], entry["page"], beginning_properties, num_pages)
+        condensed_items = self.windows.get(key)
+        if condensed_items is not None:
+            self.windows.move_to_end(key)
+            return condensed_items
+        pending = self.pending_windows.get(key)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = loop.run_in_executor(self.executor, self.condense_window, entry, num_pages)
+            self.pending_windows[key] = pending
+            try:
+                condensed_items = await pending
+            finally:
+                del self.pending_windows[key]
+            self.windows[key] = condensed_items
+            while len(self.windows) > self.max_windows:
+                self.windows.popitem(last = False)
+            return condensed_items
+        # Another request is already condensing this window.
+        return await pending
+
+    def condense_window(self, entry: dict[str, Any], num_pages: int) -> list[tuple[str, str]]:
+        self.windows_condensed += 1
+        return scrape.condense_page_window(entry, entry["page"], entry["options"].get("beginning_properties", False),
+                                           num_pages)
+
+    async def respond(self, method: str, target: str) -> tuple[int, Any]:
+        if method != "GET":
+            return (405, {"error": "only GET is supported"})
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        if url.path == "/metrics":
+            return (200, {"latency": self.latencies.report(), "windows_cached": len(self.windows),
+                          "windows_condensed": self.windows_condensed})
+        if url.path == "/health":
+            return (200, {"books": sorted(self.pdfs), "entries": sum(len(e) for e in self.entries_by_name.values())})
+        if url.path != "/blurb":
+            return (404, {"error": f"no such endpoint {url.path}"})
+        if "name" not in params:
+            return (400, {"error": "name is required"})
+        if "page" in params:
+            try:
+                int(params["page"])
+            except ValueError:
+                return (400, {"error": "page must be a number"})
+        start = time.perf_counter()
+        try:
+            entry = self.find_entry(params)
+            if entry is None:
+                return (404, {"error": f"no entry {params['name']} in the available books"})
+            blurb = await self.get_blurb(entry)
+        finally:
+            self.latencies.add((time.perf_counter() - start) * 1000)
+        if blurb is None:
+            return (404, {"error": f"could not find {params['name']} at {entry['book']} p. {entry['page']}"})
+        return (200, blurb)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves HTTP/1.1 requests on a connection until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    (key, _, value) = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    (status, body) = (400, {"error": "malformed request line"})
+                else:
+                    try:
+                        (status, body) = await self.respond(parts[0], parts[1])
+                    except Exception as e:
+                        (status, body) = (500, {"error": repr(e)})
+                data = json.dumps(body, ensure_ascii = False).encode("utf-8")
+                close = headers.get("connection", "").lower() == "close"
+                writer.write(f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                             f"Content-Type: application/json; charset=utf-8\r\n"
+                             f"Content-Length: {len(data)}\r\n"
+                             f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: str | None = None):
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, socket_path)
+            print(f"Serving blurbs on {socket_path}.")
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            print(f"Serving blurbs on http://{host}:{server.sockets[0].getsockname()[1]}/blurb?name=...")
+        async with server:
+            await server.serve_forever()
+
+
+def load_server(executor: ThreadPoolExecutor, max_windows: int = DEFAULT_MAX_WINDOWS) -> BlurbServer:
+    """
+    Identifies the sourcebooks and reads the json files once, for a BlurbServer to serve from.
+    Call it on the executor's thread.
+    """
+    pdfs = scrape.find_pdfs()
+    return BlurbServer(pdfs, scrape.get_entries(pdfs), executor, max_windows)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description = "Serve blurbs from the sourcebooks over local HTTP, "
+                                                   "e.g. GET /blurb?name=Way+of+the+Crane or /metrics.")
+    parser.add_argument("--host", default = DEFAULT_HOST)
+    parser.add_argument("--port", type = int, default = DEFAULT_PORT)
+    parser.add_argument("--socket", help = "serve on this Unix socket instead of host and port")
+    parser.add_argument("--max-windows", type = int, default = DEFAULT_MAX_WINDOWS,
+                        help = "condensed page windows to keep for later requests")
+    parser.add_argument("--max-pages", type = int, default = scrape.DEFAULT_MAX_BLURB_PAGES,
+                        help = "most pages to read a blurb from, for entries that run on past the next page")
+    parser.add_argument("--no-cache", action = "store_true",
+                        help = "extract every page from the PDFs instead of using the page cache")
+    parser.add_argument("--cache-path", default = scrape.DEFAULT_CACHE_PATH)
+    parser.add_argument("--extractor", choices = scrape.TEXT_EXTRACTORS, default = "pypdf",
+                        help = "extract page text with pypdf, or with the faster stream extractor")
+    args = parser.parse_args(argv)
+    if args.max_pages < 1:
+        parser.error(f"--max-pages {args.max_pages}: a blurb needs at least one page")
+    scrape.set_text_extractor(args.extractor)
+    scrape.set_max_blurb_pages(args.max_pages)
+    executor = ThreadPoolExecutor(1)
+    if not args.no_cache:
+        executor.submit(scrape.open_page_cache, args.cache_path).result()
+    try:
+        server = executor.submit(load_server, executor, args.max_windows).result()
+        asyncio.run(server.serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.submit(scrape.close_page_cache).result()
+        executor.shutdown()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import csv
+import json
+import os
+
+
+class DescriptionWriter:
+    """
+    Writes blurbs to the user descriptions file as they are scraped, either as the
+    CSV Paper Blossoms imports or as JSON lines. Every row is flushed to disk and
+    recorded in a checkpoint file next to the output, along with the blurb it was
+    written from, so an interrupted run can be resumed without scraping the written
+    entries again. The checkpoint is removed once the file is complete.
+    """
+
+    def __init__(self, path: str, output_format: str = "csv", resume: bool = False):
+        self.path = path
+        self.output_format = output_format
+        self.checkpoint_path = path + ".checkpoint"
+        # Blurbs of the entries already in the output, by fingerprint
+        self.written = {}
+        offset = 0
+        if resume and os.path.isfile(self.checkpoint_path) and os.path.isfile(path):
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    fields = line.split(" ", 2)
+                    if not line.endswith("\n") or len(fields) < 3:
+                        # Interrupted mid-line, so the row it was recording may be incomplete,
+                        # or written without its blurb by an older version.
+                        break
+                    (fingerprint, row_end, blurb) = fields
+                    self.written[fingerprint] = json.loads(blurb)
+                    offset = int(row_end)
+        if len(self.written) > 0:
+            self.file = open(path, "r+", encoding="utf-8", newline="")
+            # Drop anything written after the last checkpointed row.
+            self.file.seek(offset)
+            self.file.truncate()
+            self.checkpoint = open(self.checkpoint_path, "a", encoding="utf-8")
+        else:
+            self.file = open(path, "w", encoding="utf-8", newline="")
+            self.checkpoint = open(self.checkpoint_path, "w", encoding="utf-8")
+        self.csv_writer = csv.writer(self.file, quoting = csv.QUOTE_ALL, lineterminator = "\n")
+
+    def write(self, fingerprint: str, blurb: dict | None):
+        """Writes a scraped blurb, or just checkpoints the entry if nothing was found for it."""
+        if blurb is not None:
+            if self.output_format == "jsonl":
+                self.file.write(json.dumps(blurb, ensure_ascii = False) + "\n")
+            else:
+                # Paper Blossoms reads newlines as %0A and doesn't expect quotes in the text.
+                escaped_text = blurb["text"].replace('"', "'")
+                escaped_text = escaped_text.replace('\n', '%0A')
+                self.csv_writer.writerow([blurb["name"], f"{escaped_text}%0A%0A", ""])
+            self.file.flush()
+        self.checkpoint.write(f"{fingerprint} {self.file.tell()} {json.dumps(blurb)}\n")
+        self.checkpoint.flush()
+        self.written[fingerprint] = blurb
+
+    def close(self, complete: bool = True):
+        self.file.close()
+        self.checkpoint.close()
+        if complete:
+            os.remove(self.checkpoint_path)
@@ -0,0 +1,97 @@
+from array import array
+from typing import Any
+import gzip
+import json
+
+from text_items import TextItems, font_names, intern_font
+
+FIXTURE_FORMAT_VERSION = 1
+
+
+class FixtureReader:
+    """
+    Stands in for a PdfReader of a book in a fixture: it has as many pages as the PDF it
+    was recorded from, and find_text_items gives the recorded text items of the pages
+    that were recorded, and no text for the others.
+    """
+
+    def __init__(self, book: str, pdf_hash: str, num_pages: int):
+        self.book = book
+        self.pdf_hash = pdf_hash
+        self.pages = range(num_pages)
+        self.page_items = {}
+
+    def get_text_items(self, page_num: int) -> TextItems:
+        text_items = self.page_items.get(page_num)
+        return TextItems() if text_items is None else text_items
+
+
+class Fixture:
+    """
+    Recorded text items of some pages of some books, along with blurbs scraped from them,
+    so condense_text and get_blurb can be run and checked without the PDFs. Saved as
+    gzipped JSON, with each page's text items in columns and fonts by an index into the
+    fixture's own table of font names.
+    """
+
+    def __init__(self):
+        # FixtureReaders by book
+        self.readers = {}
+        # {"book", "name", "itemType", "page", "options", "blurb"} of each recorded blurb
+        self.cases = []
+
+    def add_page(self, book: str, pdf_hash: str, num_pages: int, page_num: int, text_items: TextItems):
+        reader = self.readers.get(book)
+        if reader is None:
+            reader = FixtureReader(book, pdf_hash, num_pages)
+            self.readers[book] = reader
+        reader.page_items[page_num] = text_items
+
+    def add_case(self, book: str, name: str, itemType: str, page_num: int, options: dict[str, Any],
+                 blurb: dict | None):
+        self.cases.append({"book": book, "name": name, "itemType": itemType, "page": page_num,
+                           "options": options, "blurb": blurb})
+
+    def save(self, path: str) -> None:
+        fonts = []
+        fixture_font_ids = {}
+        def fixture_font_id(font_id: int) -> int:
+            if font_id not in fixture_font_ids:
+                fixture_font_ids[font_id] = len(fonts)
+                fonts.append(font_names[font_id])
+            return fixture_font_ids[font_id]
+        books = {}
+        for (book, reader) in self.readers.items():
+            pages = {}
+            for (page_num, text_items) in sorted(reader.page_items.items()):
+                pages[str(page_num)] = {"texts": text_items.texts,
+                                        "fonts": [fixture_font_id(font_id) for font_id in text_items.fonts],
+                                        "xs": text_items.xs.tolist(), "ys": text_items.ys.tolist(),
+                                        "scales": text_items.scales.tolist()}
+            books[book] = {"hash": reader.pdf_hash, "num_pages": len(reader.pages), "pages": pages}
+        data = {"version": FIXTURE_FORMAT_VERSION, "fonts": fonts, "books": books, "cases": self.cases}
+        f = gzip.open(path, "wt", encoding="utf-8")
+        f.write(json.dumps(data, ensure_ascii = False, separators = (",", ":")))
+        f.close()
+
+    @classmethod
+    def load(cls, path: str) -> "Fixture":
+        f = gzip.open(path, "rt", encoding="utf-8")
+        data = json.loads(f.read())
+        f.close()
+        if data.get("version") != FIXTURE_FORMAT_VERSION:
+            raise ValueError(f"{path} is a version {data.get('version')} fixture; "
+                             f"this version reads version {FIXTURE_FORMAT_VERSION}.")
+        font_ids = [intern_font(font) for font in data["fonts"]]
+        fixture = cls()
+        for (book, recorded) in data["books"].items():
+            for (page_num, columns) in recorded["pages"].items():
+                text_items = TextItems()
+                text_items.texts = columns["texts"]
+                text_items.fonts = array("I", [font_ids[font] for font in columns["fonts"]])
+                text_items.xs = array("d", columns["xs"])
+                text_items.ys = array("d", columns["ys"])
+                text_items.scales = array("d", columns["scales"])
+                fixture.add_page(book, recorded["hash"], recorded["num_pages"], int(page_num), text_items)
+        fixture.cases = data["cases"]
+        return fixture
@@ -0,0 +1,107 @@
+from bisect import bisect_left
+import re
+
+BRACKET_PATTERN = re.compile(r"\s*(.*)\[(.*)\](.*)(\(.*\))?\s*")
+# Shortest name, in letters, that find_by_prefix will look up headings starting with
+MIN_PREFIX_LETTERS = 6
+# Furthest from the referenced page, in pages, that a misspelled or reworded heading is looked for
+FUZZY_MATCH_PAGES = 8
+
+
+def chars_only(name: str):
+    return ''.join([c for c in name.lower() if c.islower()])
+
+
+class HeadingIndex:
+    """
+    Every heading of a book by its letters-only form, so a heading can be found without
+    knowing its page. Headings like "Name [Group]" are also indexed by the part before
+    the bracket. Lookups try an exact match, then the bracketed form, then names within a
+    few edits, then headings that start with the whole name. Exact and bracketed
+    matches may be anywhere in the book and the one nearest the page the entry was expected
+    on wins. The looser matches are only taken when they leave a single heading within
+    FUZZY_MATCH_PAGES of that page, since otherwise they'd as likely be another entry's.
+    """
+
+    def __init__(self):
+        # letters-only name -> [(page, heading text)]
+        self.headings = {}
+        self.bracket_names = {}
+        self.sorted_keys = None
+
+    def add(self, page_num: int, text: str):
+        self.headings.setdefault(chars_only(text), []).append((page_num, text))
+        m = BRACKET_PATTERN.fullmatch(text)
+        if m is not None:
+            self.bracket_names.setdefault(chars_only(m.group(1)), []).append((page_num, text))
+        self.sorted_keys = None
+
+    def __len__(self) -> int:
+        return sum(len(places) for places in self.headings.values())
+
+    def find(self, name: str, near_page: int) -> tuple[int, str, str] | None:
+        """
+        Returns the page and text of the heading that best matches name, and how it matched,
+        or None if no heading matches it unambiguously.
+        """
+        key = chars_only(name)
+        if len(key) == 0:
+            return None
+        for (method, places) in [("exact", self.headings.get(key)),
+                                 ("bracket", self.bracket_names.get(key))]:
+            if places:
+                (page_num, text) = min(places, key = lambda place: abs(place[0] - near_page))
+                return (page_num, text, method)
+        for (method, places) in [("edit_distance", self.find_by_edit_distance(key)),
+                                 ("prefix", self.find_by_prefix(key))]:
+            nearby = [place for place in places if abs(place[0] - near_page) <= FUZZY_MATCH_PAGES]
+            if len(nearby) > 1:
+                return None
+            if len(nearby) == 1:
+                (page_num, text) = nearby[0]
+                return (page_num, text, method)
+        return None
+
+    def find_by_edit_distance(self, key: str) -> list[tuple[int, str]]:
+        """Headings within a quarter of the name's length in edits, closest first."""
+        max_distance = max(1, len(key) // 4)
+        best = []
+        for (other, places) in self.headings.items():
+            if abs(len(other) - len(key)) > max_distance:
+                continue
+            distance = edit_distance(key, other, max_distance)
+            if distance < max_distance:
+                (max_distance, best) = (distance, list(places))
+            elif distance == max_distance:
+                best += places
+        return best
+
+    def find_by_prefix(self, key: str) -> list[tuple[int, str]]:
+        """
+        Headings that start with the whole name, like "Name (Kata)". Headings that only share
+        its first words are as likely to be another entry's, so they aren't matched.
+        """
+        if len(key) < MIN_PREFIX_LETTERS:
+            return []
+        if self.sorted_keys is None:
+            self.sorted_keys = sorted(self.headings)
+        places = []
+        i = bisect_left(self.sorted_keys, key)
+        while i < len(self.sorted_keys) and self.sorted_keys[i].startswith(key):
+            places += self.headings[self.sorted_keys[i]]
+            i += 1
+        return places
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance between a and b, or limit + 1 if it's more than limit."""
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + (a[i - 1] != b[j - 1]))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
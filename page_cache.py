@@ -0,0 +1,133 @@
+import json
+import sqlite3
+import time
+import zlib
+
+DEFAULT_CACHE_PATH = "page_cache.sqlite"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+CACHE_FORMAT_VERSION = 1
+# Pages put kept in memory before they're written to the database in one transaction
+PUT_BATCH_PAGES = 64
+
+
+class PageCache:
+    """
+    SQLite-backed store of the visitor records pypdf produces for each page,
+    keyed by PDF content hash and page number. Records are stored as
+    [text, cm, tm, font name, font size], so a cache hit never touches the PDF.
+    Pages put are written in batches, and by flush and close, so that processes
+    sharing the cache don't wait on each other's write locks for every page. The
+    cache's size is counted as pages are written instead of summed each time.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 extractor_version: str = ""):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = f"{CACHE_FORMAT_VERSION}/{extractor_version}"
+        self.hits = 0
+        self.misses = 0
+        self._touched = {}
+        # (pdf hash, page) -> (compressed records, when put), waiting to be written
+        self._pending = {}
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS pages ("
+                        "pdf_hash TEXT, page_num INTEGER, data BLOB, size INTEGER, last_used REAL, "
+                        "PRIMARY KEY (pdf_hash, page_num))")
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != self.version:
+            # Records from another extractor or format version can't be trusted.
+            self.db.execute("DELETE FROM pages")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (self.version,))
+        self.db.commit()
+        self._size = self.size()
+
+    def get(self, pdf_hash: str, page_num: int) -> list | None:
+        pending = self._pending.get((pdf_hash, page_num))
+        if pending is not None:
+            self.hits += 1
+            return json.loads(zlib.decompress(pending[0]))
+        row = self.db.execute("SELECT data FROM pages WHERE pdf_hash = ? AND page_num = ?",
+                              (pdf_hash, page_num)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touched[(pdf_hash, page_num)] = time.time()
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, pdf_hash: str, page_num: int, records: list) -> None:
+        data = zlib.compress(json.dumps(records, ensure_ascii=False).encode("utf-8"))
+        self._pending[(pdf_hash, page_num)] = (data, time.time())
+        if len(self._pending) >= PUT_BATCH_PAGES:
+            self.write_pending()
+
+    def write_pending(self) -> None:
+        """Writes the pages put since the last write in one transaction, then evicts if it's grown too big."""
+        if len(self._pending) == 0:
+            return
+        for (pdf_hash, page_num) in self._pending:
+            row = self.db.execute("SELECT size FROM pages WHERE pdf_hash = ? AND page_num = ?",
+                                  (pdf_hash, page_num)).fetchone()
+            if row is not None:
+                self._size -= row[0]
+        self.db.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                            [(pdf_hash, page_num, data, len(data), put_time)
+                             for ((pdf_hash, page_num), (data, put_time)) in self._pending.items()])
+        self.db.commit()
+        self._size += sum(len(data) for (data, _) in self._pending.values())
+        self._pending = {}
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def size(self) -> int:
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def evict(self) -> None:
+        """Drop least recently used pages until the cache fits in max_bytes."""
+        self.write_pending()
+        # Other processes may have written or evicted pages since the size was counted.
+        self._size = self.size()
+        excess = self._size - self.max_bytes
+        if excess <= 0:
+            return
+        self.flush()
+        freed = 0
+        victims = []
+        for (pdf_hash, page_num, size) in self.db.execute(
+                "SELECT pdf_hash, page_num, size FROM pages ORDER BY last_used"):
+            if freed >= excess:
+                break
+            victims.append((pdf_hash, page_num))
+            freed += size
+        self.db.executemany("DELETE FROM pages WHERE pdf_hash = ? AND page_num = ?", victims)
+        self.db.commit()
+        self._size -= freed
+
+    def invalidate(self, pdf_hash: str | None = None) -> None:
+        """Forget the pages of one PDF, or of every PDF if no hash is given."""
+        if pdf_hash is None:
+            self.db.execute("DELETE FROM pages")
+            self._pending = {}
+        else:
+            self.db.execute("DELETE FROM pages WHERE pdf_hash = ?", (pdf_hash,))
+            self._pending = {key: page for (key, page) in self._pending.items() if key[0] != pdf_hash}
+        self.db.commit()
+        self._touched = {}
+        self._size = self.size()
+
+    def flush(self) -> None:
+        """Writes the pages put and when pages were last used."""
+        self.write_pending()
+        if len(self._touched) > 0:
+            self.db.executemany("UPDATE pages SET last_used = ? WHERE pdf_hash = ? AND page_num = ?",
+                                [(t, h, p) for ((h, p), t) in self._touched.items()])
+            self.db.commit()
+            self._touched = {}
+
+    def close(self) -> None:
+        self.flush()
+        self.db.close()
+
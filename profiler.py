@@ -0,0 +1,142 @@
+import json
+import time
+
+# How find_blurb found each entry's heading, in the order it tries them
+HEADING_MATCH_METHODS = ["substring", "chars_only", "bracket", "bracket_chars_only", "index_exact",
+                         "index_bracket", "index_edit_distance", "index_prefix", "not_found"]
+
+
+class Profiler:
+    """
+    Records wall time, CPU time, calls and pages touched for each stage of a scrape,
+    by book and item type, along with how find_blurb matched each entry's heading.
+    Stages nest, and a stage's times and pages include those of the stages inside it.
+    A stage that doesn't name its book or item type takes them from the enclosing stage.
+    """
+
+    def __init__(self):
+        # (stage, book, item type) -> [calls, wall seconds, CPU seconds, pages]
+        self.stages = {}
+        # (method, book, item type) -> entries
+        self.heading_matches = {}
+        self.active = []
+        self.labels = ("", "")
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def stage(self, name: str, book: str | None = None, item_type: str | None = None,
+              pages: int = 0) -> "ProfiledStage":
+        return ProfiledStage(self, name, book, item_type, pages)
+
+    def touch_pages(self, count: int) -> None:
+        for stage in self.active:
+            stage.pages += count
+
+    def count_heading_match(self, method: str, book: str, item_type: str) -> None:
+        key = (method, book, item_type)
+        self.heading_matches[key] = self.heading_matches.get(key, 0) + 1
+
+    def record(self, key: tuple[str, str, str], wall: float, cpu: float, pages: int, calls: int = 1) -> None:
+        totals = self.stages.get(key)
+        if totals is None:
+            self.stages[key] = [calls, wall, cpu, pages]
+        else:
+            totals[0] += calls
+            totals[1] += wall
+            totals[2] += cpu
+            totals[3] += pages
+
+    def take(self) -> dict:
+        """Returns everything recorded so far in the form merge expects, and forgets it."""
+        data = {"stages": list(self.stages.items()), "heading_matches": list(self.heading_matches.items())}
+        self.stages = {}
+        self.heading_matches = {}
+        return data
+
+    def merge(self, data: dict) -> None:
+        """Adds what another Profiler's take returned, e.g. from a worker process."""
+        for (key, (calls, wall, cpu, pages)) in data["stages"]:
+            self.record(tuple(key), wall, cpu, pages, calls)
+        for (key, count) in data["heading_matches"]:
+            key = tuple(key)
+            self.heading_matches[key] = self.heading_matches.get(key, 0) + count
+
+    def totals(self) -> dict[str, list]:
+        """[calls, wall, CPU, pages] of each stage over all books and item types, in first-seen order."""
+        totals = {}
+        for ((name, book, item_type), values) in self.stages.items():
+            stage_totals = totals.setdefault(name, [0, 0.0, 0.0, 0])
+            for k in range(4):
+                stage_totals[k] += values[k]
+        return totals
+
+    def report(self) -> dict:
+        heading_totals = {method: 0 for method in HEADING_MATCH_METHODS}
+        for ((method, book, item_type), count) in self.heading_matches.items():
+            heading_totals[method] += count
+        return {
+            "wall_seconds": time.perf_counter() - self.start_wall,
+            "cpu_seconds": time.process_time() - self.start_cpu,
+            "totals": {name: {"calls": calls, "wall_seconds": wall, "cpu_seconds": cpu, "pages": pages}
+                       for (name, (calls, wall, cpu, pages)) in self.totals().items()},
+            "stages": [{"stage": name, "book": book, "item_type": item_type, "calls": calls,
+                        "wall_seconds": wall, "cpu_seconds": cpu, "pages": pages}
+                       for ((name, book, item_type), (calls, wall, cpu, pages)) in self.stages.items()],
+            "heading_matches": heading_totals,
+            "heading_matches_by_entry": [{"method": method, "book": book, "item_type": item_type, "entries": count}
+                                         for ((method, book, item_type), count) in self.heading_matches.items()],
+            }
+
+    def write_report(self, path: str) -> None:
+        f = open(path, "w", encoding="utf-8")
+        f.write(json.dumps(self.report(), indent = 4))
+        f.close()
+
+    def summary(self) -> str:
+        report = self.report()
+        lines = [f"{'stage':<24} {'calls':>7} {'pages':>7} {'wall s':>9} {'CPU s':>9} {'% wall':>7}"]
+        for (name, totals) in report["totals"].items():
+            share = 100 * totals["wall_seconds"] / report["wall_seconds"] if report["wall_seconds"] > 0 else 0
+            lines.append(f"{name:<24} {totals['calls']:>7} {totals['pages']:>7} {totals['wall_seconds']:>9.3f} "
+                         f"{totals['cpu_seconds']:>9.3f} {share:>7.1f}")
+        lines.append(f"{'total':<24} {'':>7} {'':>7} {report['wall_seconds']:>9.3f} {report['cpu_seconds']:>9.3f}")
+        matches = report["heading_matches"]
+        lines.append("Headings found by "
+                     + ", ".join(f"{method} {matches[method]}" for method in HEADING_MATCH_METHODS[:-1])
+                     + f"; {matches['not_found']} not found.")
+        return "\n".join(lines)
+
+
+class ProfiledStage:
+    """Context manager that times one call of a stage for a Profiler."""
+    __slots__ = ["profiler", "name", "book", "item_type", "pages", "outer_labels", "start_wall", "start_cpu"]
+
+    def __init__(self, profiler: Profiler, name: str, book: str | None, item_type: str | None, pages: int):
+        self.profiler = profiler
+        self.name = name
+        self.book = book
+        self.item_type = item_type
+        self.pages = pages
+
+    def __enter__(self) -> "ProfiledStage":
+        profiler = self.profiler
+        self.outer_labels = profiler.labels
+        if self.book is None:
+            self.book = self.outer_labels[0]
+        if self.item_type is None:
+            self.item_type = self.outer_labels[1]
+        profiler.labels = (self.book, self.item_type)
+        # Registering the stage now lists outer stages before the ones nested in them.
+        profiler.stages.setdefault((self.name, self.book, self.item_type), [0, 0.0, 0.0, 0])
+        profiler.active.append(self)
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.process_time() - self.start_cpu
+        profiler = self.profiler
+        profiler.active.pop()
+        profiler.labels = self.outer_labels
+        profiler.record((self.name, self.book, self.item_type), wall, cpu, self.pages)
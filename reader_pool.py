@@ -0,0 +1,121 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import BinaryIO, TYPE_CHECKING
+import hashlib
+import io
+import mmap
+import os
+
+if TYPE_CHECKING:
+    from pypdf import PdfReader
+
+DEFAULT_MAX_READERS = 8
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ReaderPool:
+    """
+    Opens PdfReaders by path when they're first needed and keeps the most recently used
+    ones, dropping the least recently used once more than max_readers are open or their
+    PDFs add up to more than max_bytes. Readers read their PDF through map_pdf, so the
+    file's pages only take up memory once pypdf reads them, and then as the OS's shared
+    cache of the file, but pypdf's parsed objects grow with the PDF, so each reader is
+    still taken to cost the size of its PDF. The reader just asked for is always kept,
+    even if it alone is over the budget.
+    """
+
+    def __init__(self, max_readers: int = DEFAULT_MAX_READERS, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_readers = max_readers
+        self.max_bytes = max_bytes
+        # path -> (reader, size), least recently used first
+        self.readers = OrderedDict()
+        self.total_bytes = 0
+        self.opened = 0
+        self.evicted = 0
+
+    def get(self, path: str) -> PdfReader:
+        opened = self.readers.get(path)
+        if opened is not None:
+            self.readers.move_to_end(path)
+            return opened[0]
+        from pypdf import PdfReader
+        size = os.path.getsize(path)
+        reader = PdfReader(map_pdf(path))
+        self.readers[path] = (reader, size)
+        self.total_bytes += size
+        self.opened += 1
+        self.evict()
+        return reader
+
+    def evict(self) -> None:
+        while len(self.readers) > 1 and (len(self.readers) > self.max_readers
+                                         or self.total_bytes > self.max_bytes):
+            (path, (reader, size)) = self.readers.popitem(last = False)
+            self.total_bytes -= size
+            self.evicted += 1
+
+    def close(self, path: str) -> None:
+        """Forgets the reader for path, if there is one. Anything still using it can go on doing so."""
+        opened = self.readers.pop(path, None)
+        if opened is not None:
+            self.total_bytes -= opened[1]
+
+    def clear(self) -> None:
+        self.readers.clear()
+        self.total_bytes = 0
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.readers
+
+
+def map_pdf(path: str) -> BinaryIO:
+    """
+    A read-only memory map of a PDF, for a PdfReader to read from instead of the copy of
+    the whole file it would read into memory given the path. The mapped pages are the
+    OS's cache of the file, shared by every reader and process that maps it. Files that
+    can't be mapped, like empty ones, are read into memory instead.
+    """
+    f = open(path, "rb")
+    try:
+        return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        return io.BytesIO(f.read())
+    finally:
+        # The map stays valid once the file is closed.
+        f.close()
+
+def hash_stream(stream: BinaryIO) -> str:
+    """
+    SHA-256 of the contents of a PDF's stream, leaving its position as it was. Memory maps
+    are hashed where they are, without reading them into memory.
+    """
+    if isinstance(stream, mmap.mmap):
+        return hashlib.sha256(stream).hexdigest()
+    sha = hashlib.sha256()
+    position = stream.tell()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(1 << 20), b""):
+        sha.update(chunk)
+    stream.seek(position)
+    return sha.hexdigest()
+
+
+def release_page(reader: PdfReader, page_num: int) -> None:
+    """
+    Drops pypdf's parsed copy of a page's content streams, which hold the decoded page
+    content and are by far the biggest thing it keeps per page. They're parsed again
+    from the PDF if the page is ever read again.
+    """
+    from pypdf.generic import ArrayObject, IndirectObject
+    page = reader.pages[page_num]
+    if "/Contents" not in page:
+        return
+    contents = page.raw_get("/Contents")
+    references = []
+    if isinstance(contents, IndirectObject):
+        references.append(contents)
+        contents = reader.resolved_objects.get((contents.generation, contents.idnum))
+    if isinstance(contents, ArrayObject):
+        references += [reference for reference in contents if isinstance(reference, IndirectObject)]
+    for reference in references:
+        reader.resolved_objects.pop((reference.generation, reference.idnum), None)
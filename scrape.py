@@ -1,15 +1,163 @@
-from pypdf import PdfReader
-from typing import Any
+from __future__ import annotations
+from page_cache import PageCache, DEFAULT_CACHE_PATH, DEFAULT_MAX_BYTES
+from typing import Any, Callable, Iterator, TYPE_CHECKING
+from description_writer import DescriptionWriter
+from blurb_index import BlurbIndex, DEFAULT_INDEX_PATH
+from profiler import Profiler
+from heading_index import HeadingIndex, BRACKET_PATTERN, chars_only
+from text_items import TextItems, font_names
+from fixtures import Fixture, FixtureReader
+from reader_pool import ReaderPool, map_pdf, hash_stream, release_page, DEFAULT_MAX_READERS, DEFAULT_MAX_BYTES as DEFAULT_MAX_READER_BYTES
+import stream_extractor
+import argparse
+import contextlib
 import glob
+import hashlib
+import importlib
 import json
 import os
 import re
+import sys
+import weakref
+
+# pypdf takes a tenth of a second to import, and process pools another few hundredths,
+# so they're only imported by the commands that use them.
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+    from pypdf import PdfReader
 
 SCHOOL_IGNORED_PROPERTIES = ["starting techniques", "starting skills", "rings", "kata", "shūji", 
                              "ninjutsu", "ritual", "invocation", "kihō"]
+
+# Blurbs checked by test_blurbs, and recorded with their pages by record-fixture:
+# (name, item type, PDF page, get_blurb options)
+TEST_BLURB_PDF = "Legend_of_the_Five_Rings_Courts_of_Stone.pdf"
+TEST_BLURB_CASES = [
+    ("Deer", "clan", 88, {"beginning_properties": True}),
+    ("Shika", "family", 88, {"beginning_properties": True,
+                             "ignore_properties_list": ["ring increase", "skill increase", "glory"]}),
+    ("Affect of Harmlessness", "distinction", 99, {"cut_to_list": True}),
+    ("Well Connected", "distinction", 99, {"cut_to_list": True}),
+    ("Famously Neutral", "distinction", 99, {"cut_to_list": True}),
+    ("Local Flare", "passion", 100, {"cut_to_list": True}),
+    ("Decorum", "passion", 100, {"cut_to_list": True}),
+    ("Pot Stirrer", "passion", 101, {"cut_to_list": True}),
+    ("Overconfidence", "adversity", 101, {"cut_to_list": True}),
+    ("Lackluster", "adversity", 101, {"cut_to_list": True}),
+    ("Unsavory Past", "adversity", 102, {"cut_to_list": True}),
+    ("Isolation", "anxiety", 103, {"cut_to_list": True}),
+    ("Web of Lies", "anxiety", 103, {"cut_to_list": True}),
+    ("Ceremonial Tea Set", "gear", 105, {}),
+    ("Folding Fan", "gear", 105, {}),
+    ("Makeup Kit", "gear", 105, {}),
+    ("Mono Imi Fuda", "gear", 106, {}),
+    ("Folding Half-Bow", "gear", 110, {}),
+    ("Pole-Vault", "technique", 113, {}),
+    ("Trip the Leg", "technique", 113, {}),
+    ("Artful Alibi", "technique", 114, {}),
+    ("Like a Ghost", "technique", 114, {}),
+    ("Slicing Wind Kick", "technique", 115, {}),
+    ("Bayushi Deathdealer", "school", 89, {"ignore_properties_list": SCHOOL_IGNORED_PROPERTIES}),
+    ("Shika Speardancer", "school", 96, {"ignore_properties_list": SCHOOL_IGNORED_PROPERTIES}),
+    ("Togashi Chronicler", "school", 97, {"ignore_properties_list": SCHOOL_IGNORED_PROPERTIES}),
+    ]
+
+# Bump whenever a change to the scraping code changes its output, so --incremental
+# runs don't reuse blurbs scraped by the old code.
+SCRAPER_VERSION = 3
+# Scraped blurbs by entry fingerprint, for --incremental runs.
+MANIFEST_PATH = "user_descriptions.manifest.json"
+# Pages condensed together for the entries referenced on a page: that page and the next
+WINDOW_PAGES = 2
+# Most pages a blurb is read from, counting the one it's referenced on
+DEFAULT_MAX_BLURB_PAGES = 2
+
+# Output file for each --format
+OUTPUT_PATHS = {"csv": "user_descriptions.csv", "jsonl": "user_descriptions.jsonl"}
+
+# Detected book IDs and page offsets, by PDF content hash, so detection runs once per PDF.
+BOOK_REGISTRY_PATH = "book_registry.json"
+# Phrases found in the first pages of each sourcebook, in order of precedence.
+ID_MARKERS = {
+    "the mantis clan": "Mantis",
+    "courts of stone": "CoS",
+    "the land of ten thousand fortunes": "Core",
+    "welcome to the fringes of rokugan": "PoW",
+    "emerald empire": "EE",
+    "celestial realms": "CR",
+    "shadowlands": "SL",
+    "fields of victory": "FoV",
+    "game master's kit": "GMK",
+    }
+ID_MARKER_PATTERN = re.compile("|".join(re.escape(marker) for marker in ID_MARKERS))
+# Phrases in a PDF's title metadata that identify the book without reading any pages.
+TITLE_MARKERS = {
+    "mantis clan": "Mantis",
+    "courts of stone": "CoS",
+    "core rulebook": "Core",
+    "path of waves": "PoW",
+    "emerald empire": "EE",
+    "celestial realms": "CR",
+    "shadowlands": "SL",
+    "fields of victory": "FoV",
+    "game master's kit": "GMK",
+    }
+
+# Most pages determine_page_offset will extract before settling on an offset.
+OFFSET_SAMPLE_PAGES = 12
+
+# Page offsets to use instead of detecting them, by book ID. Also set by --page-offset.
+page_offset_overrides = {}
+
+# Page windows handed to a worker process at a time by condense_windows_in_pool.
+WINDOWS_PER_CHUNK = 16
+
+# Names translate_icons substitutes for RPGIcons glyphs. \uf3b8 used to be mapped to
+# Kihō as well as Ninjutsu, so Kihō never came out. Kihō's own glyph isn't known yet,
+# so it's left out until it's been seen in a book.
+ICON_NAMES = {
+    '\uf3b0': "[Succ]",
+    '\uf3b2': "[Exp]",
+    '\uf3b5': "[RingDie]",
+    '\uf3b7': "[Ritual]",
+    '\uf3b8': "[Ninjutsu]",
+    '\uf3b9': "[Kata]",
+    '\uf3ba': "[Shūji]",
+    '\uf3bc': "[Invocation]",
+    }
+icon_replacements = list(ICON_NAMES.items())
+
+# Redundant spacing, by what replaces it: spaces and tabs before a newline, spaces after
+# an opening parenthesis, spaces between brackets or before a colon after a bracket,
+# spaces before punctuation and runs of spaces.
+SPACE_PATTERN = re.compile(r"(?P<newline>[ \t]+\n)|(?P<open>\( +)|(?P<bracket>\] +(?=[\[:]))"
+                           r"|(?P<punctuation> +(?=[.,)]))|(?P<run> {2,})")
+SPACE_REPLACEMENTS = {"newline": "\n", "open": "(", "bracket": "]", "punctuation": "", "run": " "}
+# Every match of SPACE_PATTERN contains one of these.
+SPACE_MARKERS = ("  ", " \n", "\t\n", "( ", "] [", "] :", " .", " ,", " )")
+# Texts normalized in one batch are joined with a character none of the patterns match.
+BATCH_SEPARATOR = "\x00"
+BATCH_LEADING_SPACE_PATTERN = re.compile(r"\x00[ \n]+")
+
+# What extract_page_records reads pages with; set by set_text_extractor.
+TEXT_EXTRACTORS = ["pypdf", "stream"]
+text_extractor = "pypdf"
+# How far page windows are extended for blurbs that run on; set by set_max_blurb_pages.
+max_blurb_pages = DEFAULT_MAX_BLURB_PAGES
+# Set by open_page_cache; None means every page is extracted from the PDF.
+page_cache: PageCache | None = None
+pdf_hashes = weakref.WeakKeyDictionary()
+# Hashes of files by path, for the ones identified without opening a reader
+file_hashes = {}
+# Made by get_heading_index, by PDF content hash
+heading_indexes = {}
+# Set by start_profiling; None means nothing is measured.
+profiler: Profiler | None = None
+NOT_PROFILING = contextlib.nullcontext()
                              
+# Entries whose JSON reference points to another book, or to a heading their name can't
+# be matched to. Misspelled names and wrong pages are found through the book's heading index.
 substitutions = {
-     "Hands of Tides": {"name": "Hands of the Tides"},
      "Disdain for Compassion": {"name": "Disdain for a Bushidō Tenet"},
      "Disdain for Courage": {"name": "Disdain for a Bushidō Tenet"},
      "Disdain for Courtesy": {"name": "Disdain for a Bushidō Tenet"},
@@ -24,107 +172,256 @@ substitutions = {
      "Paragon of Honor": {"name": "Paragon of a Bushidō Tenet"},
      "Paragon of Righteousness": {"name": "Paragon of a Bushidō Tenet"},
      "Paragon of Sincerity": {"name": "Paragon of a Bushidō Tenet"},
-     "Ikomo Bard School": {"name": "Ikoma Bard School"},
      "Kitsu Real Wanderer School": {"name": "Kitsu Realm Wanderer School", "book": "CR"},
-     "Elxir of Recovery": {"name": "Elixir of Recovery"},
-     "Landslide Strike": {"page": 89},
      "Support of the Kakita Dueling Academy": {"name": "Support of [One Group]", "book": "Core", "page": 110}
     }
 
 
-def get_clan_blurbs(availablePDFs: dict[str, dict[str, Any]]) -> dict:
-    blurbs = []
+def get_clan_entries(availablePDFs: dict[str, dict[str, Any]]) -> Iterator[dict[str, Any]]:
     clanDicts = get_json("clans")
     for clanDict in clanDicts:
-        (name, search_name, reader, book, page_num) = find_page(clanDict, availablePDFs)
-        if reader is None:
+        entry = make_entry(clanDict, "clan", availablePDFs, beginning_properties = True)
+        if entry is None:
             pass
             # print(f"Clan {clanDict["name"]} in unavailable source {clanDict["reference"]["book"]}.")
         else:
-            blurbs.append(get_blurb(
-                name, search_name, "clan", page_num, book, reader, beginning_properties = True))
+            yield entry
         for familyDict in clanDict["families"]:
-            (name, search_name, reader, book, page_num) = find_page(familyDict, availablePDFs)
-            if reader is None:
+            entry = make_entry(familyDict, "family", availablePDFs, beginning_properties = True, 
+                               ignore_properties_list = ["ring increase", "skill increase", "glory"])
+            if entry is None:
                 pass
                 # print(f"Family {familyDict["name"]} of clan {clanDict["name"]} in unavailable source {clanDict["reference"]["book"]}.")
             else:
-                blurbs.append(get_blurb(
-                    name, search_name, "family", page_num, book,
-                    reader, beginning_properties = True, 
-                    ignore_properties_list = ["ring increase", "skill increase", "glory"]))
-    return blurbs
+                yield entry
 
-def get_school_blurbs(availablePDFs: dict[str, dict[str, Any]]):
-    blurbs = []
+def get_school_entries(availablePDFs: dict[str, dict[str, Any]]) -> Iterator[dict[str, Any]]:
     schoolDicts = get_json("schools")
     for schoolDict in schoolDicts:
-        (name, search_name, reader, book, page_num) = find_page(schoolDict, availablePDFs)
-        if reader is None:
+        entry = make_entry(schoolDict, "school", availablePDFs, 
+                           ignore_properties_list = SCHOOL_IGNORED_PROPERTIES)
+        if entry is None:
             pass
             # print(f"School {schoolDict["name"]} in unavailable source {schoolDict["reference"]["book"]}.")
         else:
-            blurbs.append(get_blurb(
-                name, search_name, "school", page_num, book, reader, 
-                ignore_properties_list = SCHOOL_IGNORED_PROPERTIES))
-    return blurbs
+            yield entry
 
-def get_adv_disadv_blurbs(availablePDFs: dict[str, dict[str, Any]]):
-    blurbs = []
+def get_adv_disadv_entries(availablePDFs: dict[str, dict[str, Any]]) -> Iterator[dict[str, Any]]:
     advListDicts = get_json("advantages_disadvantages")
     for advListDict in advListDicts:
         itemType = advListDict["name"]
         for advDict in advListDict["entries"]:
-            (name, search_name, reader, book, page_num) = find_page(advDict, availablePDFs)
-            if reader is None:
+            entry = make_entry(advDict, itemType.lower()[:-1], availablePDFs, cut_to_list = True)
+            if entry is None:
                 pass
                 # print(f"{itemType} {advDict["name"]} in unavailable source {advDict["reference"]["book"]}.")
             else:
-                blurbs.append(get_blurb(
-                    name, search_name, itemType.lower()[:-1], page_num, book, reader, cut_to_list = True))
-    return blurbs
+                yield entry
 
 
-def get_technique_blurbs(availablePDFs: dict[str, dict[str, Any]]):
-    blurbs = []
+def get_technique_entries(availablePDFs: dict[str, dict[str, Any]]) -> Iterator[dict[str, Any]]:
     techTypeDicts = get_json("techniques")
     for techTypeDict in techTypeDicts:
         type_str = techTypeDict["name"]
         for subCatDict in techTypeDict["subcategories"]:
             for techDict in subCatDict["techniques"]:
-                (name, search_name, reader, book, page_num) = find_page(techDict, availablePDFs)
-                if reader is None:
+                entry = make_entry(techDict, type_str, availablePDFs)
+                if entry is None:
                     pass
                     # print(f"{type_str} {techDict["name"]} in unavailable source {techDict["reference"]["book"]}.")
                 else:
-                    blurbs.append(get_blurb(name, search_name, type_str, page_num, book, reader))
-    return blurbs
+                    yield entry
 
 
-def get_item_blurbs(itemType: str, availablePDFs: dict[str, dict[str, Any]], **kwargs):
-    blurbs = []
+def get_item_entries(itemType: str, availablePDFs: dict[str, dict[str, Any]], **kwargs) -> Iterator[dict[str, Any]]:
     itemDicts = get_json(f"{itemType}s")
     for itemDict in itemDicts:
-        (name, search_name, reader, book, page_num) = find_page(itemDict, availablePDFs)
-        if reader is None:
+        entry = make_entry(itemDict, itemType, availablePDFs, **kwargs)
+        if entry is None:
             print(f"{itemType.title()} {itemDict["name"]} in unavailable source {itemDict["reference"]["book"]}.")
         else:
-            blurbs.append(get_blurb(name, search_name, itemType, page_num, book, reader, **kwargs))
-    return blurbs
+            yield entry
+
+def get_entries(pdfs: dict[str, dict[str, Any]]) -> list[dict[str, Any]]:
+    """Every entry of the json files whose book is among pdfs, in the order they're written out."""
+    entries = []
+    entries += get_clan_entries(pdfs)
+    entries += get_adv_disadv_entries(pdfs)
+    entries += get_technique_entries(pdfs)
+    entries += get_school_entries(pdfs)
+    return entries
+
+def find_entry(entries: list[dict[str, Any]], pdfs: dict[str, dict[str, Any]], name: str,
+               itemType: str | None = None, book: str | None = None, page: int | None = None) -> dict[str, Any] | None:
+    """
+    The entry called name, ignoring case, or with a book and printed page, one made up
+    for whatever heading is there, scraped with the options of the item type's entries.
+    """
+    if book is not None and page is not None:
+        options = next((entry["options"] for entry in entries if entry["itemType"] == itemType), {})
+        return make_entry({"name": name, "reference": {"book": book, "page": page}}, itemType or "entry", pdfs, **options)
+    for entry in entries:
+        if entry["name"].lower() == name.lower() and itemType in (None, entry["itemType"]) \
+                and book in (None, entry["book"]):
+            return entry
+    return None
+
+def iter_json_entries() -> Iterator[tuple[str, dict[str, Any]]]:
+    """Every entry of the json files with the name of its file, whatever its book."""
+    for clanDict in get_json("clans"):
+        yield ("clans", clanDict)
+        for familyDict in clanDict.get("families", []):
+            yield ("clans", familyDict)
+    for advListDict in get_json("advantages_disadvantages"):
+        for advDict in advListDict.get("entries", []):
+            yield ("advantages_disadvantages", advDict)
+    for techTypeDict in get_json("techniques"):
+        for subCatDict in techTypeDict.get("subcategories", []):
+            for techDict in subCatDict.get("techniques", []):
+                yield ("techniques", techDict)
+    for schoolDict in get_json("schools"):
+        yield ("schools", schoolDict)
+
+def validate_json() -> tuple[dict[str, int], list[str]]:
+    """
+    Checks that every entry of the json files has a name and a reference to a book and
+    printed page, returning how many entries reference each book and the problems found.
+    """
+    books = {}
+    problems = []
+    for (filename, jsonEntry) in iter_json_entries():
+        name = jsonEntry.get("name")
+        reference = jsonEntry.get("reference")
+        if not isinstance(name, str) or name.strip() == "":
+            problems.append(f"{filename}.json: entry without a name: {json.dumps(jsonEntry)[:80]}")
+        elif not isinstance(reference, dict) or not isinstance(reference.get("book"), str):
+            problems.append(f"{filename}.json: {name} doesn't reference a book.")
+        elif not isinstance(reference.get("page"), int) or isinstance(reference["page"], bool) \
+                or reference["page"] < 0:
+            problems.append(f"{filename}.json: {name} doesn't reference a page of {reference['book']}.")
+        else:
+            books[reference["book"]] = books.get(reference["book"], 0) + 1
+    return (books, problems)
+
+def get_clan_blurbs(availablePDFs: dict[str, dict[str, Any]]) -> list[dict]:
+    return get_blurbs(get_clan_entries(availablePDFs))
+
+def get_school_blurbs(availablePDFs: dict[str, dict[str, Any]]) -> list[dict]:
+    return get_blurbs(get_school_entries(availablePDFs))
+
+def get_adv_disadv_blurbs(availablePDFs: dict[str, dict[str, Any]]) -> list[dict]:
+    return get_blurbs(get_adv_disadv_entries(availablePDFs))
+
+def get_technique_blurbs(availablePDFs: dict[str, dict[str, Any]]) -> list[dict]:
+    return get_blurbs(get_technique_entries(availablePDFs))
+
+def get_item_blurbs(itemType: str, availablePDFs: dict[str, dict[str, Any]], **kwargs) -> list[dict]:
+    return get_blurbs(get_item_entries(itemType, availablePDFs, **kwargs))
     
-def make_user_description_file():
-    pdfs = find_pdfs()
-    blurbs = []
-    blurbs += get_clan_blurbs(pdfs)
-    blurbs += get_adv_disadv_blurbs(pdfs)
-    blurbs += get_technique_blurbs(pdfs)
-    blurbs += get_school_blurbs(pdfs)
-    blurbs = [blurb for blurb in blurbs if blurb is not None]
-    f = open("user_descriptions.csv", "w", encoding="utf-8")
-    for blurb in blurbs:
-        escaped_text = blurb["text"].replace('"', "'")
-        escaped_text = escaped_text.replace('\n', '%0A')
-        f.write(f'"{blurb["name"]}", "{escaped_text}%0A%0A", ""\n')
+def make_user_description_file(jobs: int = 1, incremental: bool = False, 
+                               resume: bool = False, output_format: str = "csv", 
+                               index_path: str | None = None):
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        cache_args = (None, 0) if page_cache is None else (page_cache.path, page_cache.max_bytes)
+        worker_args = cache_args + (profiler is not None, readers.max_readers, readers.max_bytes, text_extractor,
+                                    max_blurb_pages, page_offset_overrides)
+        with ProcessPoolExecutor(jobs, initializer = init_worker, initargs = worker_args) as pool:
+            write_user_description_file(pool, incremental, resume, output_format, index_path)
+    else:
+        write_user_description_file(None, incremental, resume, output_format, index_path)
+
+def write_user_description_file(pool: Executor | None, incremental: bool = False, 
+                                resume: bool = False, output_format: str = "csv", 
+                                index_path: str | None = None):
+    """
+    Scrapes every entry and streams its blurb to the output file as soon as it's ready,
+    in page order. Entries already in the manifest (with incremental) or already in the
+    output file (with resume) aren't scraped again. With index_path, the blurbs are also
+    exported to the blurb index there.
+    """
+    with profiled("find_pdfs"):
+        pdfs = find_pdfs(pool)
+    entries = get_entries(pdfs)
+    fingerprints = [get_fingerprint(entry) for entry in entries]
+    manifest = load_manifest() if incremental else {}
+    writer = DescriptionWriter(OUTPUT_PATHS[output_format], output_format, resume)
+    # The entries an interrupted run wrote belong in the manifest and the index as much as the rest.
+    manifest.update(writer.written)
+    plan = plan_entries(entries)
+    # Entries with the same fingerprint have the same blurb, so it's only scraped once.
+    changed = []
+    scraping = set()
+    for i in plan:
+        if fingerprints[i] not in manifest and fingerprints[i] not in writer.written \
+                and fingerprints[i] not in scraping:
+            changed.append(i)
+            scraping.add(fingerprints[i])
+    if incremental or resume:
+        print(f"Reusing {len(entries) - len(changed)} entries, scraping {len(changed)}.")
+    # Changed entries are a subsequence of the plan, so they're scraped in plan order too.
+    scraped_blurbs = iter_blurbs([entries[i] for i in changed], pool)
+    try:
+        for i in plan:
+            fingerprint = fingerprints[i]
+            while fingerprint not in manifest and fingerprint not in writer.written:
+                (changed_index, blurb) = next(scraped_blurbs)
+                manifest[fingerprints[changed[changed_index]]] = blurb
+            if fingerprint not in writer.written:
+                with profiled("write_output", entries[i]["book"], entries[i]["itemType"]):
+                    writer.write(fingerprint, manifest[fingerprint])
+    except BaseException:
+        writer.close(complete = False)
+        raise
+    writer.close()
+    save_manifest({fingerprint: manifest[fingerprint] for fingerprint in fingerprints if fingerprint in manifest})
+    if index_path is not None:
+        with profiled("export_index"):
+            export_blurb_index(index_path, entries, fingerprints, manifest)
+
+def export_blurb_index(path: str, entries: list[dict[str, Any]], fingerprints: list[str], 
+                       blurbs: dict[str, dict]):
+    """
+    Brings the blurb index at path up to date with the scraped blurbs, by fingerprint. 
+    Books whose entries haven't changed aren't touched, and books with no entries are dropped.
+    """
+    blurbs_by_book = {}
+    for (entry, fingerprint) in zip(entries, fingerprints):
+        book_blurbs = blurbs_by_book.setdefault(entry["book"], {})
+        if blurbs.get(fingerprint) is not None:
+            book_blurbs[fingerprint] = blurbs[fingerprint]
+    index = BlurbIndex(path)
+    try:
+        for (book, book_blurbs) in blurbs_by_book.items():
+            (added, removed) = index.update_book(book, book_blurbs)
+            if added > 0 or removed > 0:
+                print(f"Blurb index: {added} {book} entries added, {removed} removed.")
+        index.remove_other_books(set(blurbs_by_book))
+    finally:
+        index.close()
+
+
+def get_fingerprint(entry: dict[str, Any]) -> str:
+    """
+    Identifies everything a blurb is scraped from, so an entry with the same fingerprint 
+    as a manifest entry doesn't need to be scraped again. That includes max_blurb_pages,
+    since it decides how far a blurb that runs on is read.
+    """
+    key = [SCRAPER_VERSION, entry["name"], entry["search_name"], entry["itemType"], 
+           entry["book"], entry["page"], entry["hash"], entry["options"], max_blurb_pages]
+    return hashlib.sha256(json.dumps(key, ensure_ascii = False).encode("utf-8")).hexdigest()
+
+def load_manifest(path: str = MANIFEST_PATH) -> dict[str, dict]:
+    if not os.path.isfile(path):
+        return {}
+    f = open(path, "r", encoding="utf-8")
+    manifest = json.loads(f.read())
+    f.close()
+    return manifest
+
+def save_manifest(manifest: dict[str, dict], path: str = MANIFEST_PATH):
+    f = open(path, "w", encoding="utf-8")
+    f.write(json.dumps(manifest, ensure_ascii = False))
     f.close()
 
 
@@ -141,7 +438,7 @@ def get_json(filename: str) -> list[dict[str, Any]]:
     
 
                 
-def find_page(jsonEntry: dict[str, Any], pdfs: dict[str, PdfReader]) -> tuple[PdfReader, int]:
+def find_page(jsonEntry: dict[str, Any], pdfs: dict[str, dict[str, Any]]) -> tuple[str, str, str, str, int]:
     name = jsonEntry["name"]
     search_name = name
     book = jsonEntry["reference"]["book"]
@@ -151,14 +448,26 @@ def find_page(jsonEntry: dict[str, Any], pdfs: dict[str, PdfReader]) -> tuple[Pd
         search_name = substDict.get("name", name)
         book = substDict.get("book", book)
         page = substDict.get("page", page)
-    readerDict = pdfs.get(book, None)
-    if readerDict is not None:
-        return (name, search_name, readerDict["reader"], book, page + readerDict["page_offset"])
+    pdfDict = pdfs.get(book, None)
+    if pdfDict is not None:
+        return (name, search_name, pdfDict["path"], book, page + pdfDict["page_offset"])
     else:
         return (None, None, None, None, 0)
 
+def make_entry(jsonEntry: dict[str, Any], itemType: str, pdfs: dict[str, dict[str, Any]], **kwargs) -> dict[str, Any]:
+    (name, search_name, path, book, page_num) = find_page(jsonEntry, pdfs)
+    if path is None:
+        return None
+    return {"name": name, "search_name": search_name, "itemType": itemType, 
+            "page": page_num, "book": book, "path": path, 
+            "hash": pdfs[book]["hash"], "num_pages": pdfs[book]["num_pages"], "options": kwargs}
 
-def find_pdfs() -> dict[str, PdfReader]:
+
+def find_pdfs(pool: Executor | None = None) -> dict[str, dict[str, Any]]:
+    """
+    Identifies the sourcebooks among the PDFs, returning the path, content hash, page count
+    and page offset of each by book ID. Their readers are opened by open_reader when needed.
+    """
     availablePDFs = {}
     filenames = glob.glob('./*.pdf') + glob.glob('./pdfs/*.pdf')
     cur_dir = os.getcwd()
@@ -166,25 +475,103 @@ def find_pdfs() -> dict[str, PdfReader]:
         print(f"Found no PDFs in {cur_dir} or {os.path.join(cur_dir, 'pdfs')}.")
     else:
         print(f"Checking PDFs in {cur_dir} or {os.path.join(cur_dir, 'pdfs')}:")
-    for file in filenames:
-        reader = PdfReader(file)
-        file_id = get_id(reader)
+    registry = load_book_registry()
+    if pool is None:
+        identities = [identify_pdf(file, registry) for file in filenames]
+    else:
+        identities = []
+        for (identity, profile) in pool.map(identify_pdf_in_worker, filenames, [registry] * len(filenames)):
+            identities.append(identity)
+            merge_profile(profile)
+    for (file, identity) in zip(filenames, identities):
+        file_id = identity["book"]
         if file_id is not None:
-            page_offset = determine_page_offset(reader)
-            availablePDFs[file_id] = {"reader": reader, "page_offset": page_offset}
-            print(file + " identified as " + file_id + ".")
+            entry = {key: identity[key] for key in ["book", "size", "num_pages"]}
+            known = registry.get(identity["hash"])
+            if file_id not in page_offset_overrides:
+                entry["page_offset"] = identity["page_offset"]
+                entry["confidence"] = identity["confidence"]
+            elif known is not None and known["book"] == file_id and "page_offset" in known:
+                # An overridden offset isn't stored, but one detected before is kept for when it's dropped.
+                entry["page_offset"] = known["page_offset"]
+                entry["confidence"] = known["confidence"]
+            registry[identity["hash"]] = entry
+            availablePDFs[file_id] = {key: identity[key] for key in ["hash", "num_pages", "page_offset"]}
+            availablePDFs[file_id]["path"] = file
+            print(f"{file} identified as {file_id} "
+                  f"(page offset {identity["page_offset"]}, confidence {identity["confidence"]:.2f}).")
+            if identity["confidence"] < 0.5:
+                print(f"Page offset of {file} is uncertain; "
+                      f"pass --page-offset {file_id}=N if page references come out wrong.")
         else:
             print(file + " not recognized as sourcebook.")
+    save_book_registry(registry)
     print(f"No remaining PDFs to consider.")
     return availablePDFs
 
-def determine_page_offset(reader: PdfReader) -> int:
-    cur_page_num = -1
+def identify_pdf(path: str, registry: dict[str, dict[str, Any]]) -> dict[str, Any]:
+    size = os.path.getsize(path)
+    known = None
+    if any(known.get("size") == size for known in registry.values()):
+        # A file seen before doesn't need to be opened at all.
+        known = registry.get(get_file_hash(path))
+    if known is not None:
+        (file_id, pdf_hash) = (known["book"], get_file_hash(path))
+        # Registries from before page counts were kept don't have one.
+        num_pages = known["num_pages"] if "num_pages" in known else len(open_reader(path).pages)
+    else:
+        reader = open_reader(path)
+        with profiled("get_id"):
+            file_id = get_id(reader, registry)
+        if file_id is None:
+            readers.close(path)
+            return {"hash": None, "book": None, "size": 0, "num_pages": 0, "page_offset": 0, "confidence": 0.0}
+        pdf_hash = get_pdf_hash(reader)
+        file_hashes[path] = pdf_hash
+        num_pages = len(reader.pages)
+        known = registry.get(pdf_hash)
+    identity = {"hash": pdf_hash, "book": file_id, "size": size, "num_pages": num_pages, 
+                "page_offset": 0, "confidence": 0.0}
+    if file_id in page_offset_overrides:
+        identity["page_offset"] = page_offset_overrides[file_id]
+        identity["confidence"] = 1.0
+    elif known is not None and known["book"] == file_id and "page_offset" in known:
+        # Books whose offset was only ever given by --page-offset have none stored.
+        identity["page_offset"] = known["page_offset"]
+        identity["confidence"] = known["confidence"]
+    else:
+        with profiled("determine_page_offset", file_id):
+            (identity["page_offset"], identity["confidence"]) = determine_page_offset(open_reader(path))
+    return identity
+
+def identify_pdf_in_worker(path: str, registry: dict[str, dict[str, Any]]) -> tuple[dict[str, Any], dict | None]:
+    identity = identify_pdf(path, registry)
+    flush_page_cache()
+    return (identity, take_profile())
+
+def determine_page_offset(reader: PdfReader, max_pages: int = OFFSET_SAMPLE_PAGES) -> tuple[int, float]:
+    """
+    Finds the difference between PDF page indices and printed page numbers by looking
+    for printed numbers on a spread of pages from the body of the book, skipping the
+    front and back matter. Stops once one offset clearly wins or after max_pages pages.
+    Returns the offset and the fraction of sampled pages that agreed with it.
+    """
+    num_pages = len(reader.pages)
+    margin = num_pages // 10
+    body = range(margin, num_pages - margin)
+    if len(body) == 0:
+        body = range(num_pages)
+    sample_count = min(max_pages, len(body))
+    if sample_count == 0:
+        return (0, 0.0)
+    sample = sorted(set(body[(k * len(body)) // sample_count] for k in range(sample_count)))
     page_offset_confirmations = dict()
     for i in range(-5, 5):
         page_offset_confirmations[i] = 0
-    while True:
-        cur_page_num += 1
+    pages_checked = 0
+    best_confirmations = (0, 0)
+    for cur_page_num in sample:
+        pages_checked += 1
         text_items = find_text_items(reader, [cur_page_num], text_only = True)
         for possible_page_offset in range(-5, 5):
             check_num = cur_page_num - possible_page_offset
@@ -199,72 +586,351 @@ def determine_page_offset(reader: PdfReader) -> int:
         next_best_confirmations = \
             max([2 * val for (key, val) in page_offset_confirmations.items() if key != best_confirmations[1]])
         if best_confirmations[0] > next_best_confirmations:
-            return best_confirmations[1]
-    
-                    
-    
+            break
+    if best_confirmations[0] == 0:
+        return (0, 0.0)
+    return (best_confirmations[1], best_confirmations[0] / pages_checked)
+
+def load_book_registry(path: str = BOOK_REGISTRY_PATH) -> dict[str, dict[str, Any]]:
+    if not os.path.isfile(path):
+        return {}
+    f = open(path, "r", encoding="utf-8")
+    registry = json.loads(f.read())
+    f.close()
+    return registry
+
+def save_book_registry(registry: dict[str, dict[str, Any]], path: str = BOOK_REGISTRY_PATH):
+    f = open(path, "w", encoding="utf-8")
+    f.write(json.dumps(registry, indent = 4, sort_keys = True))
+    f.close()
+
 
 #def find_text_items(reader, page_num, include_following_page = True, text_only = False):
 
-def get_id(reader: PdfReader) -> str:
+def get_id(reader: PdfReader, registry: dict[str, dict[str, Any]] = {}) -> str:
+    """
+    Identifies a sourcebook from the cheapest signal available: a registry entry for
+    the exact same file, then the document's title metadata, and only then the text
+    of its first five pages, extracted one page at a time.
+    """
     if len(reader.pages) < 5:
         return None
-    initial_pages_text = grab_text(reader, range(5)).lower()
-    if "the mantis clan" in initial_pages_text:
-        return "Mantis"
-    if "courts of stone" in initial_pages_text:
-        return "CoS"
-    if "the land of ten thousand fortunes" in initial_pages_text:
-        return "Core"
-    if "welcome to the fringes of rokugan" in initial_pages_text:
-        return "PoW"
-    if "emerald empire" in initial_pages_text:
-        return "EE"
-    if "celestial realms" in initial_pages_text:
-        return "CR"
-    if "shadowlands" in initial_pages_text:
-        return "SL"
-    if "fields of victory" in initial_pages_text:
-        return "FoV"
-    if "game master's kit" in initial_pages_text:
-        return "GMK"
+    size = get_pdf_size(reader)
+    if any(known.get("size") == size for known in registry.values()):
+        known = registry.get(get_pdf_hash(reader))
+        if known is not None:
+            return known["book"]
+    file_id = get_metadata_id(reader)
+    if file_id is not None:
+        return file_id
+    found_ids = set()
+    for page_num in range(5):
+        page_text = " ".join(find_text_items(reader, [page_num], text_only = True)).lower()
+        page_text = re.sub(r"\s+", " ", page_text.replace("-\n", ""))
+        found_ids.update(ID_MARKERS[marker] for marker in ID_MARKER_PATTERN.findall(page_text))
+        # A later page can only change the answer if it could hold a marker that takes precedence.
+        if next(iter(ID_MARKERS.values())) in found_ids:
+            break
+    for file_id in ID_MARKERS.values():
+        if file_id in found_ids:
+            return file_id
+    return None
+
+def get_metadata_id(reader: PdfReader) -> str:
+    titles = []
+    try:
+        if reader.metadata is not None:
+            titles += [reader.metadata.title, reader.metadata.subject]
+        if reader.xmp_metadata is not None and reader.xmp_metadata.dc_title is not None:
+            titles += reader.xmp_metadata.dc_title.values()
+    except Exception:
+        # Malformed metadata is no reason not to look at the text.
+        pass
+    title_text = " ".join(title for title in titles if isinstance(title, str)).lower()
+    for (marker, file_id) in TITLE_MARKERS.items():
+        if marker in title_text:
+            return file_id
     return None
 
+def get_pdf_size(reader: PdfReader) -> int:
+    stream = reader.stream
+    position = stream.tell()
+    # Memory maps' seek only returns the new position from Python 3.13 on.
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
 def grab_text(reader, page_nums):
     text = ""
     for item in condense_text(find_text_items(reader, page_nums), []):
         text += item[0]
     return text
     
-def chars_only(name: str):
-    return ''.join([c for c in name.lower() if c.islower()])
-    
+def get_blurbs(entries: list[dict[str, Any]], pool: Executor | None = None) -> list[dict]:
+    """Scrapes the blurbs for entries made by make_entry, returning them in the same order."""
+    entries = list(entries)
+    blurbs = [None] * len(entries)
+    for (i, blurb) in iter_blurbs(entries, pool):
+        blurbs[i] = blurb
+    return blurbs
+
+def plan_entries(entries: list[dict[str, Any]]) -> list[int]:
+    return sorted(range(len(entries)), key = lambda i: (entries[i]["book"], entries[i]["page"], i))
+
+def iter_blurbs(entries: list[dict[str, Any]], pool: Executor | None = None) -> Iterator[tuple[int, dict]]:
+    """
+    Yields (index, blurb) for each entry as soon as it is scraped, in plan_entries order.
+    Entries are visited in (book, page) order so that every page is extracted once
+    and every page window is condensed once, however many entries share it.
+    With a process pool, the page windows are extracted and condensed by the workers
+    and only the heading matching happens here.
+    """
+    plan = plan_entries(entries)
+    if pool is None:
+        windows = condense_windows(entries, plan)
+    else:
+        windows = condense_windows_in_pool(entries, plan, pool)
+    # Blurbs from the same page window are normalized together.
+    window_blurbs = []
+    last_window = None
+    for (i, condensed_items) in zip(plan, windows):
+        if condensed_items is not last_window:
+            with profiled("normalize"):
+                normalize_blurbs([blurb for (_, blurb) in window_blurbs])
+            yield from window_blurbs
+            window_blurbs = []
+            last_window = condensed_items
+        entry = entries[i]
+        with profiled("find_blurb", entry["book"], entry["itemType"]):
+            window_blurbs.append((i, find_blurb(condensed_items, entry["name"], entry["search_name"], 
+                                                entry["itemType"], entry["page"], entry["book"], 
+                                                normalize = False, path = entry["path"], 
+                                                **entry["options"])))
+    with profiled("normalize"):
+        normalize_blurbs([blurb for (_, blurb) in window_blurbs])
+    yield from window_blurbs
+
+def condense_windows(entries: list[dict[str, Any]], plan: list[int]):
+    """Yields the condensed page window of each planned entry, in plan order."""
+    current_book = None
+    extracted_pages = {}
+    condensed_windows = {}
+    for i in plan:
+        entry = entries[i]
+        page_num = entry["page"]
+        if entry["book"] != current_book:
+            current_book = entry["book"]
+            extracted_pages = {}
+            condensed_windows = {}
+        # Pages are visited in ascending order, so anything before this window is done with.
+        extracted_pages = {p: items for (p, items) in extracted_pages.items() if p >= page_num}
+        condensed_windows = {key: items for (key, items) in condensed_windows.items() if key[0] == page_num}
+        yield condense_entry_window(entry, extracted_pages, condensed_windows)
+
+def condense_entry_window(entry: dict[str, Any], extracted_pages: dict[int, TextItems],
+                          condensed_windows: dict[tuple[int, bool, int], list[tuple[str, str]]]
+                          ) -> list[tuple[str, str]]:
+    """
+    Condenses an entry's page window, reusing the pages and windows already done, which
+    are kept by page and by (page, beginning_properties, number of pages). The window takes
+    in the following pages one at a time, up to max_blurb_pages, for as long as the entry's
+    blurb carries on to the end of it.
+    """
+    (page_num, beginning_properties) = (entry["page"], entry["options"].get("beginning_properties", False))
+    window_pages = WINDOW_PAGES
+    while True:
+        window_key = (page_num, beginning_properties, window_pages)
+        if window_key not in condensed_windows:
+            with profiled("page_window", entry["book"], entry["itemType"]):
+                condensed_windows[window_key] = condense_page_window(entry, page_num, beginning_properties,
+                                                                     window_pages, extracted_pages)
+        if not window_carries_on(condensed_windows[window_key], entry, window_pages):
+            return condensed_windows[window_key]
+        window_pages += 1
+
+def condense_reader_window(reader, entry: dict[str, Any]) -> list[tuple[str, str]]:
+    """
+    Same as condense_entry_window, but for an entry whose pages are read from an open
+    reader, such as one whose heading was found in the book's heading index.
+    """
+    (extracted_pages, window_pages) = ({}, WINDOW_PAGES)
+    while True:
+        text_items = TextItems()
+        for p in page_window(entry["page"], entry["num_pages"], window_pages):
+            if p not in extracted_pages:
+                extracted_pages[p] = extract_page(reader, p)
+            text_items += extracted_pages[p]
+        condensed_items = condense_text(text_items, entry["options"].get("beginning_properties", False))
+        if not window_carries_on(condensed_items, entry, window_pages):
+            return condensed_items
+        window_pages += 1
+
+def condense_page_window(book: dict[str, Any], page_num: int, beginning_properties: bool,
+                         window_pages: int = WINDOW_PAGES, extracted_pages: dict[int, TextItems] | None = None
+                         ) -> list[tuple[str, str]]:
+    """
+    Condenses the page window of page_num in a book from find_pdfs, or of an entry's book,
+    extracting only the pages that aren't in extracted_pages.
+    """
+    if extracted_pages is None:
+        extracted_pages = {}
+    text_items = TextItems()
+    for p in page_window(page_num, book["num_pages"], window_pages):
+        if p not in extracted_pages:
+            extracted_pages[p] = extract_book_page(book["path"], book["hash"], p)
+        text_items += extracted_pages[p]
+    with profiled("condense_text"):
+        return condense_text(text_items, beginning_properties)
+
+def window_carries_on(condensed_items: list[tuple[str, str]], entry: dict[str, Any], window_pages: int) -> bool:
+    """
+    Whether an entry's page window of window_pages pages should take in the next page too:
+    the blurb isn't known to end within it, and the next page is in the book and allowed.
+    """
+    if window_pages >= max_blurb_pages or entry["page"] + window_pages >= entry["num_pages"]:
+        return False
+    return not blurb_ends_within(condensed_items, entry["search_name"], entry["itemType"],
+                                 entry["options"].get("ignore_properties_list", []),
+                                 entry["options"].get("cut_to_list", False))
+
+def page_window(page_num: int, book_pages: int, num_pages: int = WINDOW_PAGES) -> list[int]:
+    """The page an entry is referenced on and the ones after, leaving out any that aren't in the book."""
+    return [p for p in range(page_num, page_num + num_pages) if 0 <= p < book_pages]
+
+def condense_windows_in_pool(entries: list[dict[str, Any]], plan: list[int], pool: Executor):
+    """
+    Same as condense_windows, but each book's page windows are split into runs of
+    neighbouring pages and condensed by the pool's workers.
+    """
+    chunks = []
+    # (chunk, window) of each planned entry
+    planned_windows = []
+    # Page and beginning_properties of the last window of the last chunk
+    last_window = None
+    for i in plan:
+        entry = entries[i]
+        (path, window) = (entry["path"], (entry["page"], entry["options"].get("beginning_properties", False)))
+        if len(chunks) == 0 or chunks[-1][0] != path or last_window != window:
+            if len(chunks) == 0 or chunks[-1][0] != path or len(chunks[-1][2]) >= WINDOWS_PER_CHUNK:
+                chunks.append((path, entry["hash"], []))
+            # The entries on each window, whose blurbs decide how far it's extended
+            chunks[-1][2].append([])
+            last_window = window
+        chunks[-1][2][-1].append(entry)
+        planned_windows.append((len(chunks) - 1, len(chunks[-1][2]) - 1, len(chunks[-1][2][-1]) - 1))
+    chunk_results = pool.map(condense_window_chunk, chunks)
+    current_chunk = -1
+    for (chunk_index, window_index, entry_index) in planned_windows:
+        while current_chunk < chunk_index:
+            (condensed_chunk, profile) = next(chunk_results)
+            merge_profile(profile)
+            current_chunk += 1
+        yield condensed_chunk[window_index][entry_index]
+
+def condense_window_chunk(chunk: tuple[str, str, list[list[dict[str, Any]]]]
+                          ) -> tuple[list[list[list[tuple[str, str]]]], dict | None]:
+    """
+    Condenses a run of page windows in a worker, returning the window of each of their
+    entries with its profile if profiling. Entries that share a window share its list.
+    """
+    (path, pdf_hash, windows) = chunk
+    file_hashes[path] = pdf_hash
+    extracted_pages = {}
+    condensed_windows = {}
+    results = []
+    for window_entries in windows:
+        results.append([condense_entry_window(entry, extracted_pages, condensed_windows)
+                        for entry in window_entries])
+    flush_page_cache()
+    return (results, take_profile())
+
 def get_blurb(name: str, search_name: str, itemType: str, page_num: int, book: str, reader: PdfReader, 
               ignore_properties_list: list[str] = [], 
               beginning_properties: bool = False,
-              cut_to_list: bool = False, verbose: bool = False) -> str:
-    condensed_items = condense_text(find_text_items(reader, [page_num, page_num + 1]), beginning_properties)
-    headings = \
-        [(i, condensed_items[i][0]) for i in range(0, len(condensed_items)) 
-                                    if 'Heading' == condensed_items[i][1]]
-    possible_positions = \
-        [i for (i, text) in headings if search_name.lower() in condensed_items[i][0].lower()]
-    if len(possible_positions) == 0:
-        possible_positions = \
-            [i for (i, text) in headings if chars_only(search_name) in chars_only(text)]
-    if len(possible_positions) == 0:
-        matches = [(i, re.fullmatch(r"\s*(.*)\[(.*)\](.*)(\(.*\))?\s*", text)) for (i, text) in headings]
-        possible_positions = [i for (i, m) in matches 
-                                if m is not None and m.group(1).lower() in search_name.lower()]
-        if len(possible_positions) == 0:
-            possible_positions = [i for (i, m) in matches 
-                                    if m is not None 
-                                       and chars_only(m.group(1)) in chars_only(search_name)]
-    if len(possible_positions) == 0:
+              cut_to_list: bool = False, verbose: bool = False,
+              max_pages: int = DEFAULT_MAX_BLURB_PAGES) -> str:
+    """
+    Scrapes an entry's blurb from as few pages as it takes: the page it's referenced on,
+    then the pages after it one at a time, up to max_pages in all, for as long as the
+    heading isn't found or the blurb carries on to the end of the pages so far.
+    """
+    with profiled("get_blurb", book, itemType):
+        text_items = TextItems()
+        condensed_items = []
+        for p in page_window(page_num, len(reader.pages), max_pages):
+            text_items += find_text_items(reader, [p])
+            with profiled("condense_text"):
+                condensed_items = condense_text(text_items, beginning_properties)
+            if blurb_ends_within(condensed_items, search_name, itemType, ignore_properties_list, cut_to_list):
+                break
+        return find_blurb(condensed_items, name, search_name, itemType, page_num, book, 
+                          ignore_properties_list = ignore_properties_list, cut_to_list = cut_to_list, 
+                          beginning_properties = beginning_properties, verbose = verbose, reader = reader)
+
+def find_blurb(condensed_items: list[tuple[str, str]], name: str, search_name: str, itemType: str, 
+               page_num: int, book: str, 
+               ignore_properties_list: list[str] = [], 
+               beginning_properties: bool = False,
+               cut_to_list: bool = False, verbose: bool = False, normalize: bool = True,
+               path: str | None = None, reader: PdfReader | None = None) -> str:
+    """
+    Finds the entry's heading among the condensed items of its page window and puts its
+    blurb together. If the heading isn't there and the book's path or reader is given,
+    it's looked up in the book's heading index and the blurb is taken from wherever it is.
+    """
+    (heading_position, match_method) = find_heading(condensed_items, search_name)
+    if heading_position is None and (path is not None or reader is not None):
+        if reader is None:
+            reader = open_reader(path)
+        found = get_heading_index(reader).find(search_name, page_num)
+        if found is not None:
+            (found_page_num, heading_text, index_method) = found
+            # The blurb may run on past the found page's window just as it may past the entry's own.
+            condensed_items = condense_reader_window(reader, {
+                "page": found_page_num, "num_pages": len(reader.pages), "search_name": heading_text,
+                "itemType": itemType, "options": {"ignore_properties_list": ignore_properties_list,
+                                                  "beginning_properties": beginning_properties,
+                                                  "cut_to_list": cut_to_list}})
+            (heading_position, _) = find_heading(condensed_items, heading_text)
+            print(f"Found {itemType} {name} as {heading_text} at {book} p. {found_page_num}"
+                  + (f" instead of p. {page_num}." if found_page_num != page_num else "."))
+            (page_num, match_method) = (found_page_num, "index_" + index_method)
+    if heading_position is None:
+        match_method = "not_found"
+    if profiler is not None:
+        profiler.count_heading_match(match_method, book, itemType)
+    if heading_position is None:
         print(f"Could not find {itemType} {name} at {book} p. {page_num}.")
         return None
-    heading_position = possible_positions[-1]
-    
+    (blurb, _) = assemble_blurb(condensed_items, heading_position, itemType, ignore_properties_list,
+                                cut_to_list, verbose)
+    blurb = blurb.lstrip("\n").rstrip()
+    if normalize:
+        blurb = eliminate_extra_space(translate_icons(blurb))
+    return {"name": name, "itemType": itemType, "text": blurb, 
+            "book": book, "page": page_num}
+
+def blurb_ends_within(condensed_items: list[tuple[str, str]], search_name: str, itemType: str,
+                      ignore_properties_list: list[str] = [], cut_to_list: bool = False) -> bool:
+    """
+    Whether the entry's heading is among the condensed items and its blurb ends before
+    the last of them, which may still carry on onto the next page.
+    """
+    (heading_position, _) = find_heading(condensed_items, search_name)
+    if heading_position is None:
+        return False
+    (_, end) = assemble_blurb(condensed_items, heading_position, itemType, ignore_properties_list, cut_to_list)
+    return end is not None and end < len(condensed_items) - 1
+
+def assemble_blurb(condensed_items: list[tuple[str, str]], heading_position: int, itemType: str,
+                   ignore_properties_list: list[str] = [], cut_to_list: bool = False,
+                   verbose: bool = False) -> tuple[str, int | None]:
+    """
+    Puts together the blurb following the heading at heading_position. Returns it with the
+    position of the item that ended it: the next heading or brushtip ornament, or a
+    school's *ADVANCE, or None if it runs to the end of the items.
+    """
     blurb = ""
     i = heading_position + 1
     next_font = ''
@@ -298,7 +964,7 @@ def get_blurb(name: str, search_name: str, itemType: str, page_num: int, book: s
         elif itemType == "school" and "*ADVANCE" in condensed_items[i][0]:
             text = condensed_items[i][0] 
             blurb += text[:text.find("*ADVANCE")].strip()
-            break
+            return (blurb, i)
         elif 'Basic' == next_font:
             blurb += condensed_items[i][0].rstrip() + " "
         elif 'PropertyName' == next_font:
@@ -310,131 +976,350 @@ def get_blurb(name: str, search_name: str, itemType: str, page_num: int, book: s
         if verbose:
             print(i, next_font, condensed_items[i][0])
         i = i + 1
-    blurb = blurb.lstrip("\n")
-    blurb = eliminate_extra_space(translate_icons(blurb.rstrip()))
-    return {"name": name, "itemType": itemType, "text": blurb, 
-            "book": book, "page": page_num}
+    if 'Heading' in next_font or 'brushtip' in next_font:
+        return (blurb, i - 1)
+    return (blurb, None)
 
-def find_text_items(reader, page_nums, text_only = False):
-    text_items = []
-    if text_only: 
-        visitor = lambda a,b,c,d,e: text_items.append(a)
-    else:
-        visitor = lambda a,b,c,d,e: text_items.append([a,b,c,d,e])
+def find_heading(condensed_items: list[tuple[str, str]], search_name: str) -> tuple[int | None, str]:
+    """Position of the last heading matching search_name, and which kind of match found it."""
+    headings = \
+        [(i, condensed_items[i][0]) for i in range(0, len(condensed_items)) 
+                                    if 'Heading' == condensed_items[i][1]]
+    match_method = "substring"
+    possible_positions = \
+        [i for (i, text) in headings if search_name.lower() in condensed_items[i][0].lower()]
+    if len(possible_positions) == 0:
+        match_method = "chars_only"
+        possible_positions = \
+            [i for (i, text) in headings if chars_only(search_name) in chars_only(text)]
+    if len(possible_positions) == 0:
+        match_method = "bracket"
+        matches = [(i, BRACKET_PATTERN.fullmatch(text)) for (i, text) in headings]
+        possible_positions = [i for (i, m) in matches 
+                                if m is not None and m.group(1).lower() in search_name.lower()]
+        if len(possible_positions) == 0:
+            match_method = "bracket_chars_only"
+            possible_positions = [i for (i, m) in matches 
+                                    if m is not None 
+                                       and chars_only(m.group(1)) in chars_only(search_name)]
+    if len(possible_positions) == 0:
+        return (None, "not_found")
+    return (possible_positions[-1], match_method)
+
+def get_heading_index(reader: PdfReader) -> HeadingIndex:
+    """
+    The index of every heading in a book, made the first time an entry's heading isn't
+    on its page. Making it condenses every page of the book, one page at a time.
+    """
+    pdf_hash = get_pdf_hash(reader)
+    index = heading_indexes.get(pdf_hash)
+    if index is None:
+        with profiled("build_heading_index"):
+            index = HeadingIndex()
+            for page_num in range(len(reader.pages)):
+                for (text, font) in condense_text(find_text_items(reader, [page_num]), False):
+                    if font == 'Heading':
+                        index.add(page_num, text)
+        heading_indexes[pdf_hash] = index
+    return index
+
+def find_text_items(reader, page_nums, text_only = False) -> TextItems | list[str]:
+    text_items = TextItems()
     for page_num in page_nums:
+        text_items += extract_page(reader, page_num)
+    if text_only:
+        return text_items.texts
+    return text_items
+
+def extract_page(reader, page_num) -> TextItems:
+    if profiler is not None:
+        profiler.touch_pages(1)
+    if isinstance(reader, FixtureReader):
+        return reader.get_text_items(page_num)
+    if page_cache is None:
+        with profiled("extract_text", pages = 1):
+            return TextItems.from_records(extract_page_records(reader, page_num))
+    return extract_cached_page(get_pdf_hash(reader), page_num, lambda: reader)
+
+def extract_book_page(path: str, pdf_hash: str, page_num: int) -> TextItems:
+    """Same as extract_page, but only opens the book's reader if the page isn't in the page cache."""
+    if page_cache is None:
+        return extract_page(open_reader(path), page_num)
+    if profiler is not None:
+        profiler.touch_pages(1)
+    file_hashes[path] = pdf_hash
+    return extract_cached_page(pdf_hash, page_num, lambda: open_reader(path))
+
+def extract_cached_page(pdf_hash: str, page_num: int, get_reader: Callable[[], PdfReader]) -> TextItems:
+    with profiled("read_page_cache"):
+        records = page_cache.get(pdf_hash, page_num)
+    if records is None:
+        reader = get_reader()
+        with profiled("extract_text", pages = 1):
+            records = [[text, cm, tm, None if font is None else font.get('/BaseFont', ''), size]
+                       for (text, cm, tm, font, size) in extract_page_records(reader, page_num)]
+        page_cache.put(pdf_hash, page_num, records)
+    return TextItems.from_records(records)
+
+def extract_page_records(reader, page_num):
+    if text_extractor == "stream":
+        text_items = stream_extractor.extract_records(reader, page_num)
+    else:
+        text_items = []
+        visitor = lambda a,b,c,d,e: text_items.append([a,[float(x) for x in b],[float(x) for x in c],d,e])
         reader.pages[page_num].extract_text(visitor_text=visitor)
+    # Pages are only extracted once per run, so there's no point keeping them parsed.
+    release_page(reader, page_num)
     return text_items
 
+def get_pdf_hash(reader) -> str:
+    pdf_hash = pdf_hashes.get(reader)
+    if pdf_hash is None:
+        with profiled("hash_pdf"):
+            pdf_hash = hash_stream(reader.stream)
+        pdf_hashes[reader] = pdf_hash
+    return pdf_hash
+
+def get_file_hash(path: str) -> str:
+    """
+    Same as get_pdf_hash, straight from the file. The file is hashed through a memory map,
+    so its pages are left in the OS's cache for a reader that opens it next.
+    """
+    pdf_hash = file_hashes.get(path)
+    if pdf_hash is None:
+        with profiled("hash_pdf"):
+            with map_pdf(path) as stream:
+                pdf_hash = hash_stream(stream)
+        file_hashes[path] = pdf_hash
+    return pdf_hash
+
 
 def condense_text(text_items, beginning_properties) -> list[tuple[str, str]]:
+    """
+    Merges runs of text into (text, font) items, where font is the role the text plays:
+    Heading, Basic, PropertyName or PropertyValue, or the raw font name otherwise.
+    Works in a single pass, appending to a TextBuffer that is only joined once an item
+    is finished, and classifying each distinct font name once. Takes TextItems, or
+    extractor records, which are converted to TextItems first.
+    """
+    if not isinstance(text_items, TextItems):
+        text_items = TextItems.from_records(text_items)
+    (texts, fonts, xs, ys, scales) = (text_items.texts, text_items.fonts, text_items.xs, text_items.ys,
+                                      text_items.scales)
     condensed_items = []
     current_font = ''
-    aggregate_text = ''
+    aggregate_text = TextBuffer()
     last_item = None
+    last_font_class = None
     icon_text = ""
-    for i in range(0, len(text_items)):
+    for i in range(0, len(texts)):
         end_text = ''
-        text_item = text_items[i]
-        if text_item[3] is None:
+        text = texts[i]
+        if len(text.strip()) == 0:
+            continue
+        font = font_names[fonts[i]]
+        if font is None:
             font = ''
-        else:
-            font = text_item[3]['/BaseFont']
-        if text_item[0].startswith('\n') or text_items[i-1][0].endswith('\n'):
+        font_class = font_classes.get(font)
+        if font_class is None:
+            font_class = classify_font(font)
+        if text.startswith('\n') or texts[i-1].endswith('\n'):
             new_line = True
         else:
             new_line = False
-        if len(text_item[0].strip()) == 0:
-            continue
-        if text_item[2][0] < 8 and 'Ornament' not in font and last_item is not None \
-           and last_item[3] is not None and 'Ornament' not in last_item[3]['/BaseFont']:
+        if scales[i] < 8 and not font_class.ornament and last_item is not None \
+           and fonts[last_item] != 0 and not last_font_class.ornament:
             continue
-        if 'RPGIcons' in font:
-            icon_text += text_item[0] + " "
+        if font_class.rpg_icons:
+            icon_text += text + " "
         next_font = font
         next_text = ""
         if current_font != font:
-            if 'BiolinumOB' in font:
+            if font_class.heading:
                 if 'Heading' != current_font:
                     next_font = 'Heading'
                     finish_item = True
                 else:
                     finish_item = False
-            elif text_item[0].rstrip().endswith(":") and 'Heavy' in font:
+            elif font_class.heavy and text.rstrip().endswith(":"):
                 next_font = 'PropertyName'
                 if len(icon_text) > 0:
-                    aggregate_text = aggregate_text[:-len(icon_text)]
+                    aggregate_text.drop(len(icon_text))
                     next_text = icon_text
                     icon_text = ""
-                while aggregate_text.strip().endswith("*"):
-                    aggregate_text = aggregate_text.strip()[:-1]
-                    heavy_init = aggregate_text.rfind('*')
-                    next_text = aggregate_text[heavy_init+1:] + " " + next_text
-                    aggregate_text = aggregate_text[:heavy_init].strip()
+                # Heavy text just before a property name is part of the name.
+                if aggregate_text.last_visible_char() == "*":
+                    heavy_text = aggregate_text.text()
+                    while heavy_text.strip().endswith("*"):
+                        heavy_text = heavy_text.strip()[:-1]
+                        heavy_init = heavy_text.rfind('*')
+                        next_text = heavy_text[heavy_init+1:] + " " + next_text
+                        heavy_text = heavy_text[:heavy_init].strip()
+                    aggregate_text = TextBuffer(heavy_text)
                 finish_item = True
             elif current_font == 'PropertyName':
                 next_font = 'PropertyValue'
                 finish_item = True
             elif current_font == 'PropertyValue' and not new_line:
                 finish_item = False
-            elif current_font == 'PropertyValue' and not beginning_properties and 'Avenir' in font:
+            elif current_font == 'PropertyValue' and not beginning_properties and font_class.avenir:
                 finish_item = False
-            elif 'Avenir' in font:
+            elif font_class.avenir:
                 if 'Basic' != current_font:
                     next_font = 'Basic'
                     finish_item = True
                 else:
                     finish_item = False
-            elif 'RPGIcons' in font:
+            elif font_class.rpg_icons:
                 finish_item = False
             else:
                 finish_item = True
             if finish_item:
-                if len(aggregate_text.strip()) > 0:
-                    condensed_items.append((remove_redundancy(aggregate_text.strip()), current_font))
+                finished_text = aggregate_text.text().strip()
+                if len(finished_text) > 0:
+                    condensed_items.append((finished_text, current_font))
                 current_font = next_font
-                aggregate_text = next_text
-        if 'RPGIcons' not in font:
+                aggregate_text = TextBuffer(next_text)
+        if not font_class.rpg_icons:
             icon_text = ""
         # Reproduce indentation
         if (len(aggregate_text) > 0 
-             and text_item[2][4] - last_item[2][4] > 1
-             and text_item[2][5] - last_item[2][5] < -1 
-             and '$' not in aggregate_text):
-            aggregate_text = aggregate_text.strip() + "\n\t"
-        if current_font in ['Basic', 'PropertyValue']:
-            if 'Oblique' in font:
+             and xs[i] - xs[last_item] > 1
+             and ys[i] - ys[last_item] < -1 
+             and not aggregate_text.has_bullet()):
+            aggregate_text.strip()
+            aggregate_text.append("\n\t")
+        if current_font == 'Basic' or current_font == 'PropertyValue':
+            if font_class.oblique:
                 end_text = '/'
-            if 'Heavy' in font:
+            if font_class.heavy:
                 end_text += '*'
-            aggregate_text += end_text[::-1]
+            if len(end_text) > 0:
+                aggregate_text.append(end_text[::-1])
             
         # Recombine words with weird font changes in the middle.
-        if len(text_item[0]) == 1 and 'Avenir' in font:
+        if len(text) == 1 and font_class.avenir:
             if aggregate_text.endswith(" "):
-                aggregate_text = aggregate_text[:-1]
+                aggregate_text.drop(1)
             if aggregate_text.endswith("/ /"):
-                aggregate_text = aggregate_text[:-3]
+                aggregate_text.drop(3)
             if aggregate_text.endswith("* *"):
-                aggregate_text = aggregate_text[:-3]
+                aggregate_text.drop(3)
         # Remove hyphenation
         if current_font == "PropertyName":
-            aggregate_text += text_item[0].strip().rstrip(":")
-        elif text_item[0][-1] == '-':
-            aggregate_text += text_item[0][:-1].strip()
-        elif text_item[0].endswith('-\n'):
-            aggregate_text += text_item[0][:-2].strip()
-        elif text_item[0][-1] == '\n':
-            aggregate_text += text_item[0].strip()
-            end_text += " "
-        elif text_item[0][-1] == ' ':
-            aggregate_text += text_item[0].strip()
-            end_text += " "
+            aggregate_text.append(text.strip().rstrip(":") + end_text)
+        elif text[-1] == '-':
+            aggregate_text.append(text[:-1].strip() + end_text)
+        elif text.endswith('-\n'):
+            aggregate_text.append(text[:-2].strip() + end_text)
+        elif text[-1] == '\n' or text[-1] == ' ':
+            aggregate_text.append(text.strip() + end_text + " ")
         else:
-            aggregate_text += text_item[0]
-            end_text += " "
-        aggregate_text += end_text
-        last_item = text_item
-    return condensed_items
+            aggregate_text.append(text + end_text + " ")
+        last_item = i
+        last_font_class = font_class
+    texts = remove_redundancy_batch([text for (text, font) in condensed_items])
+    return [(text, font) for (text, (_, font)) in zip(texts, condensed_items)]
+
+class FontClass:
+    """What condense_text needs to know about a font, worked out once per font name."""
+    __slots__ = ("heading", "avenir", "heavy", "oblique", "ornament", "rpg_icons")
+
+    def __init__(self, font: str):
+        self.heading = 'BiolinumOB' in font
+        self.avenir = 'Avenir' in font
+        self.heavy = 'Heavy' in font
+        self.oblique = 'Oblique' in font
+        self.ornament = 'Ornament' in font
+        self.rpg_icons = 'RPGIcons' in font
+
+font_classes = {}
+
+def classify_font(font: str) -> FontClass:
+    font_class = FontClass(font)
+    font_classes[font] = font_class
+    return font_class
+
+class TextBuffer:
+    """
+    Text being aggregated by condense_text. Kept as a list of pieces, so appending, 
+    trimming the end and checking for bullets don't copy the text gathered so far.
+    """
+    __slots__ = ("parts", "length", "bullets")
+
+    def __init__(self, text: str = ""):
+        self.parts = [text] if len(text) > 0 else []
+        self.length = len(text)
+        self.bullets = text.count('$')
+
+    def __len__(self) -> int:
+        return self.length
+
+    def append(self, text: str):
+        if len(text) > 0:
+            self.parts.append(text)
+            self.length += len(text)
+            self.bullets += text.count('$')
+
+    def has_bullet(self) -> bool:
+        return self.bullets > 0
+
+    def tail(self, count: int) -> str:
+        """The last count characters, or all of them if there are fewer."""
+        tail = ""
+        i = len(self.parts) - 1
+        while len(tail) < count and i >= 0:
+            tail = self.parts[i][len(tail) - count:] + tail
+            i -= 1
+        return tail
+
+    def endswith(self, suffix: str) -> bool:
+        return self.tail(len(suffix)).endswith(suffix)
+
+    def last_visible_char(self) -> str:
+        """The last character that isn't whitespace, or "" if there isn't one."""
+        for i in range(len(self.parts) - 1, -1, -1):
+            part = self.parts[i].rstrip()
+            if len(part) > 0:
+                return part[-1]
+        return ""
+
+    def drop(self, count: int):
+        """Removes the last count characters."""
+        while count > 0 and len(self.parts) > 0:
+            part = self.parts.pop()
+            if len(part) > count:
+                removed = part[-count:]
+                self.parts.append(part[:-count])
+            else:
+                removed = part
+            self.length -= len(removed)
+            self.bullets -= removed.count('$')
+            count -= len(removed)
+
+    def strip(self):
+        while len(self.parts) > 0:
+            part = self.parts[-1].rstrip()
+            self.length -= len(self.parts[-1]) - len(part)
+            if len(part) > 0:
+                self.parts[-1] = part
+                break
+            self.parts.pop()
+        start = 0
+        while start < len(self.parts):
+            part = self.parts[start].lstrip()
+            self.length -= len(self.parts[start]) - len(part)
+            if len(part) > 0:
+                self.parts[start] = part
+                break
+            start += 1
+        if start > 0:
+            del self.parts[:start]
+
+    def text(self) -> str:
+        text = "".join(self.parts)
+        self.parts = [text] if len(text) > 0 else []
+        return text
     
 def print_blurb(name, typeName, page, reader, **kwargs):
     print(typeName + " " + name)
@@ -442,42 +1327,51 @@ def print_blurb(name, typeName, page, reader, **kwargs):
     print("\n\n")
     
 def test_blurbs():
-    reader = PdfReader('Legend_of_the_Five_Rings_Courts_of_Stone.pdf')
-    print_blurb("Deer", "clan", 88, reader, beginning_properties = True)
-    print_blurb("Shika", "family", 88, reader, beginning_properties = True, ignore_properties_list = ["ring increase", "skill increase", "glory"])
-    print_blurb("Affect of Harmlessness", "distinction", 99, reader, cut_to_list = True)
-    print_blurb("Well Connected", "distinction", 99, reader, cut_to_list = True)
-    print_blurb("Famously Neutral", "distinction", 99, reader, cut_to_list = True)
+    reader = open_reader(TEST_BLURB_PDF)
+    for (name, itemType, page, options) in TEST_BLURB_CASES:
+        print_blurb(name, itemType, page, reader, **options)
 
-    print_blurb("Local Flare", "passion", 100, reader, cut_to_list = True)
-    print_blurb("Decorum", "passion", 100, reader, cut_to_list = True)
-    print_blurb("Pot Stirrer", "passion", 101, reader, cut_to_list = True)
-    
-    print_blurb("Overconfidence", "adversity", 101, reader, cut_to_list = True)
-    print_blurb("Lackluster", "adversity", 101, reader, cut_to_list = True)
-    print_blurb("Unsavory Past", "adversity", 102, reader, cut_to_list = True)
+def record_fixture(fixture_path: str, path: str, book: str, page_nums: list[int] = [],
+                   cases: list[tuple[str, str, int, dict[str, Any]]] = []) -> Fixture:
+    """
+    Records the text items of the page windows of page_nums and of each case, a (name,
+    item type, page, options) tuple like those of TEST_BLURB_CASES, along with the blurb
+    get_blurb scrapes for each case, and saves them as a fixture at fixture_path.
+    """
+    reader = open_reader(path)
+    fixture = Fixture()
+    for page_num in list(page_nums) + [page_num for (_, _, page_num, _) in cases]:
+        for p in page_window(page_num, len(reader.pages)):
+            fixture.add_page(book, get_pdf_hash(reader), len(reader.pages), p, find_text_items(reader, [p]))
+    for (name, itemType, page_num, options) in cases:
+        fixture.add_case(book, name, itemType, page_num, options,
+                         get_blurb(name, name, itemType, page_num, book, reader, **options))
+    fixture.save(fixture_path)
+    return fixture
 
-    print_blurb("Isolation", "anxiety", 103, reader, cut_to_list = True)
-    print_blurb("Web of Lies", "anxiety", 103, reader, cut_to_list = True)
-    
-    print_blurb("Ceremonial Tea Set", "gear", 105, reader)
-    print_blurb("Folding Fan", "gear", 105, reader)
-    print_blurb("Makeup Kit", "gear", 105, reader)    
-    print_blurb("Mono Imi Fuda", "gear", 106, reader)
-    print_blurb("Folding Half-Bow", "gear", 110, reader)
+def load_fixture(path: str) -> Fixture:
+    fixture = Fixture.load(path)
+    for reader in fixture.readers.values():
+        # Heading indexes made from the PDF itself would cover pages the fixture doesn't have.
+        pdf_hashes[reader] = "fixture-" + reader.pdf_hash
+    return fixture
 
-    print_blurb("Pole-Vault", "technique", 113, reader)
-    print_blurb("Trip the Leg", "technique", 113, reader)
-    print_blurb("Artful Alibi", "technique", 114, reader)
-    print_blurb("Like a Ghost", "technique", 114, reader)
-    print_blurb("Slicing Wind Kick", "technique", 115, reader)
-    
-    print_blurb("Bayushi Deathdealer", "school", 89, reader, 
-                ignore_properties_list = SCHOOL_IGNORED_PROPERTIES)
-    print_blurb("Shika Speardancer", "school", 96, reader, 
-                ignore_properties_list = SCHOOL_IGNORED_PROPERTIES)
-    print_blurb("Togashi Chronicler", "school", 97, reader, 
-                ignore_properties_list = SCHOOL_IGNORED_PROPERTIES)
+def check_fixture(fixture: Fixture, verbose: bool = False) -> int:
+    """
+    Scrapes the blurb of each of the fixture's cases from its recorded pages and compares
+    it with the recorded blurb. Returns the number that came out differently.
+    """
+    mismatches = 0
+    for case in fixture.cases:
+        blurb = get_blurb(case["name"], case["name"], case["itemType"], case["page"], case["book"],
+                          fixture.readers[case["book"]], **case["options"])
+        if blurb != case["blurb"]:
+            mismatches += 1
+            print(f"{case['itemType']} {case['name']} ({case['book']} p. {case['page']}) differs.")
+            if verbose:
+                print(f"  expected {case['blurb'] and case['blurb']['text']!r}\n"
+                      f"  actual   {blurb and blurb['text']!r}")
+    return mismatches
 
 def scrape_all():
     pdfs = find_pdfs()
@@ -495,6 +1389,9 @@ def scrape_all():
 
 def remove_redundancy(text) -> str:
     text = eliminate_extra_space(text)
+    return remove_emphasis_marks(text)
+
+def remove_emphasis_marks(text) -> str:
     text = text.replace("/ /"," ")
     text = text.replace("* *"," ")
     text = text.replace("//","")
@@ -502,35 +1399,369 @@ def remove_redundancy(text) -> str:
     return text
 
 def eliminate_extra_space(text) -> str:
-    size = len(text)
-    text = text.replace("  "," ")
-    text = text.replace(" \n", "\n")
-    text = text.replace("\t\n", "\n")
-    text = text.replace(" .",".")
-    text = text.replace(" ,",",")
-    text = text.replace("( ","(")
-    text = text.replace(" )",")")
-    text = text.replace("] [","][")
-    text = text.replace("] :","]:")
-    if text.startswith(" ") or text.startswith("\n"):
-        text = text[1:]
-    if len(text) < size:
-        return eliminate_extra_space(text)
-    else:
-        return text
+    """
+    Removes redundant spaces in one pass, with the same result as applying SPACE_PATTERN's
+    replacements and stripping leading spaces and newlines until nothing changes.
+    """
+    if has_extra_space(text):
+        text = SPACE_PATTERN.sub(replace_space, text)
+    return text.lstrip(" \n")
+
+def has_extra_space(text) -> bool:
+    # Most text has nothing to remove, and finding that out with str's substring search
+    # is much faster than scanning it with SPACE_PATTERN.
+    for marker in SPACE_MARKERS:
+        if marker in text:
+            return True
+    return False
+
+def replace_space(match: re.Match) -> str:
+    return SPACE_REPLACEMENTS[match.lastgroup]
     
 def translate_icons(text) -> str:
-    text = text.replace('\uf3b0', "[Succ]")
-    text = text.replace('\uf3b2', "[Exp]")
-    text = text.replace('\uf3b5', "[RingDie]")
-    text = text.replace('\uf3b9', "[Kata]")
-    text = text.replace('\uf3ba', "[Shūji]")
-    text = text.replace('\uf3b7', "[Ritual]")
-    text = text.replace('\uf3bc', "[Invocation]")
-    text = text.replace('\uf3b8', "[Ninjutsu]")
-    text = text.replace('\uf3b8', "[Kihō]")
+    # Most pages have only a few of the glyphs, and str.replace is far faster than
+    # str.translate or a regex over text that isn't pure ASCII.
+    for (glyph, icon_name) in icon_replacements:
+        if glyph in text:
+            text = text.replace(glyph, icon_name)
     return text
 
+def set_icon_names(icon_names: dict[str, str]):
+    """Changes the text translate_icons substitutes for each RPGIcons glyph."""
+    global icon_replacements
+    icon_replacements = list(icon_names.items())
+
+def eliminate_extra_space_batch(texts: list[str], before: Callable[[str], str] | None = None,
+                                after: Callable[[str], str] | None = None) -> list[str]:
+    """
+    after(eliminate_extra_space(before(text))) for many texts at once, with a single regex
+    pass over all of them. before and after are applied to all the texts joined together,
+    so they have to be replacements that can't reach from one text into the next.
+    """
+    if len(texts) < 2 or any(BATCH_SEPARATOR in text for text in texts):
+        results = []
+        for text in texts:
+            text = eliminate_extra_space(text if before is None else before(text))
+            results.append(text if after is None else after(text))
+        return results
+    joined_text = BATCH_SEPARATOR.join(texts)
+    if before is not None:
+        joined_text = before(joined_text)
+    if has_extra_space(joined_text):
+        joined_text = SPACE_PATTERN.sub(replace_space, joined_text)
+    joined_text = BATCH_LEADING_SPACE_PATTERN.sub(BATCH_SEPARATOR, joined_text).lstrip(" \n")
+    if after is not None:
+        joined_text = after(joined_text)
+    return joined_text.split(BATCH_SEPARATOR)
+
+def remove_redundancy_batch(texts: list[str]) -> list[str]:
+    """remove_redundancy for many texts at once, with a single regex pass over all of them."""
+    return eliminate_extra_space_batch(texts, after = remove_emphasis_marks)
+
+def normalize_blurbs(blurbs: list[dict]):
+    """Translates icons and removes redundant spaces in the text of every blurb at once."""
+    blurbs = [blurb for blurb in blurbs if blurb is not None]
+    texts = eliminate_extra_space_batch([blurb["text"] for blurb in blurbs], before = translate_icons)
+    for (blurb, text) in zip(blurbs, texts):
+        blurb["text"] = text
+
+
+def open_page_cache(path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES) -> PageCache:
+    global page_cache
+    import pypdf
+    extractor_version = f"pypdf-{pypdf.__version__}"
+    if text_extractor == "stream":
+        extractor_version = f"stream-{stream_extractor.VERSION}/{extractor_version}"
+    page_cache = PageCache(path, max_bytes, extractor_version = extractor_version)
+    return page_cache
+
+def set_text_extractor(name: str):
+    """
+    Changes what extracts the text records of pages: "pypdf" for pypdf's extract_text,
+    or "stream" for stream_extractor, which gives the same records several times faster.
+    Call it before open_page_cache, since each keeps its own cache.
+    """
+    global text_extractor
+    if name not in TEXT_EXTRACTORS:
+        raise ValueError(f"unknown text extractor {name}; use one of {', '.join(TEXT_EXTRACTORS)}")
+    text_extractor = name
+
+def set_max_blurb_pages(num_pages: int):
+    """
+    Changes how many pages, counting the one it's referenced on, a blurb that runs on past
+    its page window may be read from.
+    """
+    global max_blurb_pages
+    if num_pages < 1:
+        raise ValueError(f"a blurb needs at least one page, not {num_pages}")
+    max_blurb_pages = num_pages
+
+# Readers by path. Worker processes open their own, so PdfReaders never cross process boundaries.
+readers = ReaderPool()
+
+def init_worker(cache_path: str | None, cache_max_bytes: int, profiling: bool = False,
+                max_readers: int = DEFAULT_MAX_READERS, max_reader_bytes: int = DEFAULT_MAX_READER_BYTES,
+                extractor: str = "pypdf", max_pages: int = DEFAULT_MAX_BLURB_PAGES,
+                page_offsets: dict[str, int] = {}):
+    set_text_extractor(extractor)
+    set_max_blurb_pages(max_pages)
+    # Workers started with spawn rather than fork don't inherit main's --page-offset overrides.
+    page_offset_overrides.update(page_offsets)
+    if cache_path is not None:
+        open_page_cache(cache_path, cache_max_bytes)
+    if profiling:
+        start_profiling()
+    set_reader_limits(max_readers, max_reader_bytes)
+
+def open_reader(path: str) -> PdfReader:
+    if path in readers:
+        return readers.get(path)
+    with profiled("open_reader"):
+        reader = readers.get(path)
+    # A reader opened again after being evicted doesn't need hashing again.
+    if path in file_hashes:
+        pdf_hashes[reader] = file_hashes[path]
+    return reader
+
+def set_reader_limits(max_readers: int, max_bytes: int):
+    """Changes how many PDFs, and how many bytes of them, open_reader keeps open at once."""
+    readers.max_readers = max_readers
+    readers.max_bytes = max_bytes
+    readers.evict()
+
+def start_profiling() -> Profiler:
+    global profiler
+    profiler = Profiler()
+    return profiler
+
+def profiled(stage: str, book: str | None = None, itemType: str | None = None, pages: int = 0):
+    """Times the enclosed code as a stage of the run if profiling, and does nothing otherwise."""
+    if profiler is None:
+        return NOT_PROFILING
+    return profiler.stage(stage, book, itemType, pages)
+
+def take_profile() -> dict | None:
+    """What a worker process has profiled since the last call, for merge_profile in the main process."""
+    return None if profiler is None else profiler.take()
+
+def merge_profile(profile: dict | None):
+    if profile is not None and profiler is not None:
+        profiler.merge(profile)
+
+def flush_page_cache():
+    """Writes what the page cache holds in memory, which a worker process does after each task."""
+    if page_cache is not None:
+        page_cache.flush()
+
+def close_page_cache():
+    global page_cache
+    if page_cache is not None:
+        page_cache.close()
+        page_cache = None
+
+# Commands main runs without ever importing scrape's heavy dependencies, handed straight to their own modules
+PASSTHROUGH_COMMANDS = {"lookup": "blurb_index", "bench": "bench"}
+COMMANDS = ["scrape", "identify", "offset", "dump-page", "blurb", "validate", "record-fixture", "check-fixture"] \
+    + list(PASSTHROUGH_COMMANDS)
+
+def main(argv: list[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) > 0 and argv[0] in PASSTHROUGH_COMMANDS:
+        command_module = importlib.import_module(PASSTHROUGH_COMMANDS[argv[0]])
+        if argv[0] == "lookup":
+            return command_module.main(argv)
+        return command_module.main(argv[1:])
+    # Options without a command scrape, as they always have.
+    if len(argv) == 0 or (argv[0] not in COMMANDS and argv[0] not in ["-h", "--help"]):
+        argv = ["scrape"] + argv
+    parser = argparse.ArgumentParser(description = "Create a Paper Blossoms user descriptions file from L5R sourcebooks.")
+    commands = parser.add_subparsers(dest = "command", required = True, metavar = "command")
+    cache_options = argparse.ArgumentParser(add_help = False)
+    cache_options.add_argument("--no-cache", action = "store_true", 
+                               help = "extract every page from the PDFs instead of using the page cache")
+    cache_options.add_argument("--cache-path", default = DEFAULT_CACHE_PATH)
+    cache_options.add_argument("--extractor", choices = TEXT_EXTRACTORS, default = "pypdf",
+                               help = "extract page text with pypdf, or read the content streams directly "
+                                      "with the faster stream extractor")
+    book_options = argparse.ArgumentParser(add_help = False)
+    book_options.add_argument("--page-offset", action = "append", default = [], metavar = "BOOK=N",
+                              help = "use offset N between PDF pages and printed page numbers for BOOK "
+                                     "(e.g. Core=2) instead of detecting it")
+
+    command = commands.add_parser("scrape", parents = [cache_options, book_options],
+                                  help = "write the user descriptions file (the default)")
+    command.add_argument("--clear-cache", action = "store_true", 
+                         help = "empty the page cache before scraping")
+    command.add_argument("--cache-size", type = int, default = DEFAULT_MAX_BYTES // (1024 * 1024),
+                         help = "maximum page cache size in megabytes")
+    command.add_argument("--incremental", action = "store_true",
+                         help = "only scrape entries that are new or changed since the last run")
+    command.add_argument("--resume", action = "store_true",
+                         help = "continue an interrupted run, keeping the entries it already wrote")
+    command.add_argument("--format", choices = ["csv", "jsonl"], default = "csv",
+                         help = "write user_descriptions.csv for Paper Blossoms, or user_descriptions.jsonl")
+    command.add_argument("--jobs", "-j", type = int, default = 1,
+                         help = "number of worker processes for identifying, extracting and condensing pages")
+    command.add_argument("--index", nargs = "?", const = DEFAULT_INDEX_PATH, metavar = "PATH",
+                         help = "also export the blurbs to a searchable SQLite index at PATH "
+                                f"(default {DEFAULT_INDEX_PATH}) for python -m scrape lookup")
+    command.add_argument("--max-pages", type = int, default = DEFAULT_MAX_BLURB_PAGES,
+                         help = "most pages to read a blurb from, for entries that run on past the next page")
+    command.add_argument("--max-open-pdfs", type = int, default = DEFAULT_MAX_READERS,
+                         help = "most PDFs to keep open at once; the least recently used are closed first")
+    command.add_argument("--pdf-memory", type = int, default = DEFAULT_MAX_READER_BYTES // (1024 * 1024),
+                         help = "most megabytes of open PDFs to keep in memory at once")
+    command.add_argument("--profile", nargs = "?", const = "profile.json", metavar = "PATH",
+                         help = "time each stage of the run by book and item type, print a summary "
+                                "and write the full report to PATH (default profile.json)")
+
+    commands.add_parser("identify", parents = [cache_options, book_options],
+                        help = "list the sourcebooks among the PDFs and their page offsets")
+
+    command = commands.add_parser("offset", parents = [cache_options],
+                                  help = "detect the offset between a PDF's pages and its printed page numbers")
+    command.add_argument("pdf")
+    command.add_argument("--pages", type = int, default = OFFSET_SAMPLE_PAGES, help = "most pages to sample")
+
+    command = commands.add_parser("dump-page", parents = [cache_options],
+                                  help = "print the condensed text items of a PDF page")
+    command.add_argument("pdf")
+    command.add_argument("page", type = int, help = "PDF page number, counting from 0")
+    command.add_argument("--window", action = "store_true",
+                         help = "include the following page, as get_blurb does")
+    command.add_argument("--beginning-properties", action = "store_true",
+                         help = "condense as for entries whose properties come before their text, like clans")
+    command.add_argument("--raw", action = "store_true",
+                         help = "print the extracted text items instead of condensing them")
+
+    command = commands.add_parser("blurb", parents = [cache_options, book_options],
+                                  help = "scrape the blurb of one entry")
+    command.add_argument("name")
+    command.add_argument("--type", dest = "itemType", help = "item type of the entry, e.g. technique")
+    command.add_argument("--book", help = "book of the entry, e.g. CoS")
+    command.add_argument("--page", type = int,
+                         help = "printed page of the entry's heading; with --book, the entry needn't be in the json files")
+    command.add_argument("--max-pages", type = int, default = DEFAULT_MAX_BLURB_PAGES,
+                         help = "most pages to read the blurb from, for entries that run on past the next page")
+    command.add_argument("--verbose", action = "store_true")
+
+    commands.add_parser("validate", help = "check that every json entry has a name and a book and page reference")
+    command = commands.add_parser("record-fixture", parents = [cache_options],
+                                  help = "record the text items of page windows, and the test blurbs, for check-fixture")
+    command.add_argument("fixture", help = "path of the fixture to write, e.g. cos.fixture.json.gz")
+    command.add_argument("--pdf", default = TEST_BLURB_PDF)
+    command.add_argument("--book", default = "CoS", help = "book the PDF is, e.g. CoS")
+    command.add_argument("--window", type = int, nargs = "+", default = [], metavar = "PAGE",
+                         help = "record the windows of these PDF pages instead of the test blurbs' pages and blurbs")
+    command = commands.add_parser("check-fixture",
+                                  help = "scrape the blurbs recorded in a fixture from its pages, without the PDFs")
+    command.add_argument("fixture")
+    command.add_argument("--verbose", action = "store_true", help = "print the blurbs that differ")
+    commands.add_parser("lookup", add_help = False,
+                        help = "look up blurbs in the index written by scrape --index (see lookup --help)")
+    commands.add_parser("bench", add_help = False,
+                        help = "benchmark the scraper on synthetic sourcebooks (see bench --help)")
+    args = parser.parse_args(argv)
+    for override in getattr(args, "page_offset", []):
+        (book, separator, offset) = override.partition("=")
+        if separator == "":
+            parser.error(f"--page-offset {override}: expected BOOK=N, e.g. Core=2")
+        if book not in ID_MARKERS.values():
+            parser.error(f"--page-offset {override}: unknown book {book!r}; "
+                         f"use one of {', '.join(ID_MARKERS.values())}")
+        try:
+            page_offset_overrides[book] = int(offset)
+        except ValueError:
+            parser.error(f"--page-offset {override}: the offset must be a whole number, e.g. {book}=2")
+    if getattr(args, "max_pages", 1) < 1:
+        parser.error(f"--max-pages {args.max_pages}: a blurb needs at least one page")
+
+    if args.command == "validate":
+        try:
+            (books, problems) = validate_json()
+        except Exception as e:
+            print(e)
+            return 1
+        for problem in problems:
+            print(problem)
+        print(f"{sum(books.values())} entries reference "
+              + ", ".join(f"{book} ({count})" for (book, count) in sorted(books.items()))
+              + f"; {len(problems)} problems.")
+        return 1 if len(problems) > 0 else 0
+    if args.command == "check-fixture":
+        fixture = load_fixture(args.fixture)
+        mismatches = check_fixture(fixture, args.verbose)
+        print(f"{len(fixture.cases) - mismatches} of {len(fixture.cases)} recorded blurbs match.")
+        return 1 if mismatches > 0 else 0
+
+    set_text_extractor(args.extractor)
+    if not args.no_cache:
+        open_page_cache(args.cache_path, getattr(args, "cache_size", DEFAULT_MAX_BYTES // (1024 * 1024)) * 1024 * 1024)
+    try:
+        if args.command == "scrape":
+            return run_scrape(args)
+        if args.command == "identify":
+            return 0 if len(find_pdfs()) > 0 else 1
+        if args.command == "offset":
+            (page_offset, confidence) = determine_page_offset(open_reader(args.pdf), args.pages)
+            print(f"{args.pdf}: page offset {page_offset} (confidence {confidence:.2f}).")
+            return 0
+        if args.command == "dump-page":
+            reader = open_reader(args.pdf)
+            if not 0 <= args.page < len(reader.pages):
+                print(f"{args.pdf} has no page {args.page}; it has pages 0 to {len(reader.pages) - 1}.")
+                return 1
+            page_nums = page_window(args.page, len(reader.pages)) if args.window else [args.page]
+            text_items = find_text_items(reader, page_nums)
+            if args.raw:
+                for row in text_items.rows():
+                    print(json.dumps(row, ensure_ascii = False))
+            else:
+                for (text, font) in condense_text(text_items, args.beginning_properties):
+                    print(f"{font}\t{text!r}")
+            return 0
+        if args.command == "blurb":
+            pdfs = find_pdfs()
+            entry = find_entry(get_entries(pdfs), pdfs, args.name, args.itemType, args.book, args.page)
+            if entry is None:
+                print(f"No entry {args.name} in the available books.")
+                return 1
+            blurb = get_blurb(entry["name"], entry["search_name"], entry["itemType"], entry["page"], entry["book"],
+                              open_reader(entry["path"]), verbose = args.verbose, max_pages = args.max_pages,
+                              **entry["options"])
+            if blurb is None:
+                return 1
+            print(f"{blurb['name']} ({blurb['itemType']}, {blurb['book']})\n{blurb['text']}")
+            return 0
+        if args.command == "record-fixture":
+            cases = [] if len(args.window) > 0 else TEST_BLURB_CASES
+            fixture = record_fixture(args.fixture, args.pdf, args.book, args.window, cases)
+            num_pages = sum(len(reader.page_items) for reader in fixture.readers.values())
+            print(f"Recorded {num_pages} pages and {len(cases)} blurbs to {args.fixture}.")
+            # Blurbs found through the heading index need pages outside their window.
+            mismatches = check_fixture(load_fixture(args.fixture), verbose = True)
+            if mismatches > 0:
+                print(f"{mismatches} of the blurbs don't come out the same from the recorded pages.")
+                return 1
+            return 0
+    finally:
+        close_page_cache()
+
+def run_scrape(args: argparse.Namespace) -> int:
+    if args.clear_cache and page_cache is not None:
+        page_cache.invalidate()
+    set_reader_limits(args.max_open_pdfs, args.pdf_memory * 1024 * 1024)
+    set_max_blurb_pages(args.max_pages)
+    if args.profile is not None:
+        start_profiling()
+    with profiled("make_user_description_file"):
+        make_user_description_file(args.jobs, args.incremental, args.resume, args.format, args.index)
+    if profiler is not None:
+        profiler.write_report(args.profile)
+        print(profiler.summary())
+        print(f"Profile written to {args.profile}.")
+    return 0
+
 
 if __name__ == "__main__":
-    make_user_description_file()
\ No newline at end of file
+    sys.exit(main())
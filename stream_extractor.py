@@ -0,0 +1,579 @@
+from __future__ import annotations
+from functools import reduce
+from itertools import repeat
+from math import sqrt
+from operator import add
+from typing import Any, TYPE_CHECKING
+import re
+import weakref
+
+if TYPE_CHECKING:
+    from pypdf import PdfReader
+
+# Bump whenever a change to the extractor changes the records it gives, so cached pages are redone.
+VERSION = 1
+
+# One token of a content stream and the whitespace before it; whitespace at the very end
+# matches nothing. Literal strings may nest one level of unescaped parentheses; anything
+# deeper, or anything else unexpected, is "other".
+TOKEN_PATTERN = re.compile(rb"""
+    [\x00\t\n\f\r ]*
+    (?:
+      (?P<number>[+,\-.0-9]+)
+    | (?P<operator>[A-Za-z'"][^\t\n\v\f\r ()<>\[\]{}/%]*)
+    | (?P<string>\((?:[^()\\]|\\.|\((?:[^()\\]|\\.)*\))*\))
+    | (?P<name>/[^\t\n\v\f\r ()<>\[\]{}/%]*)
+    | (?P<array>\[)
+    | (?P<array_end>\])
+    | (?P<hex><[0-9A-Fa-f\x00\t\n\f\r ]*>)
+    | (?P<dict><<)
+    | (?P<dict_end>>>)
+    | (?P<comment>%[^\r\n]*)
+    | (?P<other>[^\x00\t\n\f\r ])
+    )
+    """, re.VERBOSE | re.DOTALL)
+ESCAPE_PATTERN = re.compile(rb"\\([0-7]{1,3}|[\r\n][\r\n]?|.)", re.DOTALL)
+ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f",
+           **{bytes((c,)): bytes((c,)) for c in b"()/\\ %<>[]#_&$"}}
+HEX_WHITESPACE = b"\x00\t\n\f\r "
+KEYWORDS = (b"true", b"false", b"null")
+# Characters pypdf writes right to left
+RTL_PATTERN = re.compile("[\u0590-\u08ff\ufb1d-\ufdff\ufe70-\ufeff]")
+# Space width pypdf's extract_text assumes for fonts that don't give one
+DEFAULT_SPACE_WIDTH = 200.0
+IDENTITY = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+
+# Parsed fonts by reader and font object reference, shared by all the pages that use them
+font_caches = weakref.WeakKeyDictionary()
+# Pages handed to pypdf because they use something this extractor doesn't handle
+fallback_pages = 0
+
+
+class UnsupportedContent(Exception):
+    pass
+
+
+class StreamFont:
+    """
+    What extraction needs of a font: its encoding, ToUnicode map and glyph widths.
+    Holds nothing of the PDF itself, so it can outlive the pages that use it.
+    """
+    __slots__ = ["encoding", "unicode_map", "space_width", "widths", "default_width", "translation",
+                 "byte_text", "byte_widths", "undecodable"]
+
+    def __init__(self, encoding, unicode_map: dict, font, space_width: float):
+        from pypdf._cmap import build_font_width_map, compute_font_width, get_actual_str_key
+        self.encoding = encoding
+        self.unicode_map = unicode_map
+        self.space_width = space_width
+        if font is None:
+            widths = {"default": space_width * 2}
+            space_char = " "
+            actual_space_width = space_width
+        else:
+            space_char = get_actual_str_key(" ", encoding, unicode_map)
+            widths = build_font_width_map(font, space_width * 2)
+            actual_space_width = compute_font_width(widths, space_char)
+        if actual_space_width == 0:
+            actual_space_width = space_width
+        # Widths by character, with the one pypdf takes for the space character
+        self.widths = dict(widths)
+        self.widths[space_char] = actual_space_width
+        self.default_width = widths["default"]
+        # Only single characters are ever looked up in the ToUnicode map.
+        self.translation = {ord(key): value for (key, value) in unicode_map.items()
+                            if isinstance(key, str) and len(key) == 1}
+        # Single-byte encodings decode, map and measure each byte the same way every time.
+        self.byte_text = None
+        self.byte_widths = None
+        self.undecodable = None
+        if isinstance(encoding, dict):
+            decoded = [encoding[b] if b in encoding else (chr(b) if b < 128 else None) for b in range(256)]
+            if all(c is None or len(c) == 1 for c in decoded):
+                self.byte_text = [None if c is None else unicode_map.get(c, c) for c in decoded]
+                self.byte_widths = [None if c is None else self.widths.get(c, self.default_width) for c in decoded]
+                # pypdf fails on bytes its encoding doesn't have.
+                undecodable = bytes(b for (b, c) in enumerate(decoded) if c is None)
+                if len(undecodable) > 0:
+                    self.undecodable = re.compile(b"[" + re.escape(undecodable) + b"]")
+
+
+def get_font_cache(reader: PdfReader) -> dict:
+    cache = font_caches.get(reader)
+    if cache is None:
+        cache = font_caches[reader] = {}
+    return cache
+
+def load_font(page, name: str, font_cache: dict) -> tuple[Any, StreamFont | None]:
+    """
+    The page's font dictionary called name, and what's needed to extract its text,
+    which is None for fonts pypdf can't make a character map for.
+    """
+    from pypdf._cmap import build_char_map_from_dict
+    font = page["/Resources"]["/Font"][name]
+    reference = font.indirect_reference
+    key = None if reference is None else (reference.idnum, reference.generation)
+    if key is not None and key in font_cache:
+        return (font, font_cache[key])
+    try:
+        (_, half_space_width, encoding, unicode_map) = build_char_map_from_dict(DEFAULT_SPACE_WIDTH, font)
+        stream_font = StreamFont(encoding, unicode_map, font, half_space_width)
+    except TypeError:
+        stream_font = None
+    if key is not None:
+        font_cache[key] = stream_font
+    return (font, stream_font)
+
+def get_unknown_font(font_cache: dict) -> StreamFont:
+    font = font_cache.get("unknown")
+    if font is None:
+        from pypdf._cmap import unknown_char_map
+        font = font_cache["unknown"] = StreamFont(unknown_char_map[2], unknown_char_map[3], None, unknown_char_map[1])
+    return font
+
+def get_content_data(page) -> bytes | None:
+    """The page's decoded content, concatenated the way pypdf's ContentStream does it."""
+    from pypdf.generic import ArrayObject, ContentStream, NullObject, StreamObject
+    try:
+        content = page["/Contents"].get_object()
+    except (AttributeError, KeyError):
+        return None
+    if isinstance(content, ContentStream):
+        raise UnsupportedContent("already parsed content stream")
+    if isinstance(content, ArrayObject):
+        data = b""
+        for part in content:
+            part = part.get_object()
+            if isinstance(part, NullObject):
+                continue
+            if not isinstance(part, StreamObject):
+                raise UnsupportedContent("content array entry that isn't a stream")
+            data += part.get_data() + b"\n"
+        return data
+    return content.get_data()
+
+def unescape(string: bytes) -> bytes:
+    return ESCAPE_PATTERN.sub(replace_escape, string)
+
+def replace_escape(match: re.Match) -> bytes:
+    escaped = match.group(1)
+    if escaped[0] in b"01234567":
+        code = int(escaped, 8)
+        # pypdf keeps the backslash and reads the digits again as text.
+        return b"\\" + escaped if code > 255 else bytes((code,))
+    if escaped[0] in b"\r\n":
+        return b""
+    # Like pypdf, keep the backslash of escapes that don't mean anything.
+    return ESCAPES.get(escaped, b"\\" + escaped)
+
+def mult(m: list[float], n: list[float]) -> list[float]:
+    return [
+        m[0] * n[0] + m[1] * n[2],
+        m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2],
+        m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4],
+        m[4] * n[1] + m[5] * n[3] + n[5],
+    ]
+
+def has_custom_rtl() -> bool:
+    """Whether pypdf's right-to-left settings have been changed from their defaults."""
+    from pypdf import _text_extraction
+    return (_text_extraction.CUSTOM_RTL_MIN, _text_extraction.CUSTOM_RTL_MAX,
+            _text_extraction.CUSTOM_RTL_SPECIAL_CHARS) != (-1, -1, [])
+
+
+def extract_records(reader: PdfReader, page_num: int) -> list[list]:
+    """
+    The records pypdf's extract_text passes its visitor_text for a page, as
+    [text, cm, tm, font dict, font size], found by reading the page's content stream
+    directly. Pages with inline images, form XObjects or anything it can't parse are
+    extracted by pypdf instead.
+    """
+    global fallback_pages
+    page = reader.pages[page_num]
+    try:
+        return StreamTextExtraction(page, get_font_cache(reader)).run()
+    except Exception:
+        fallback_pages += 1
+        return extract_records_with_pypdf(page)
+
+def extract_records_with_pypdf(page) -> list[list]:
+    records = []
+    visitor = lambda a,b,c,d,e: records.append([a,[float(x) for x in b],[float(x) for x in c],d,e])
+    page.extract_text(visitor_text=visitor)
+    return records
+
+
+class StreamTextExtraction:
+    """
+    The text state machine of pypdf's TextExtraction, cut down to the operators that
+    affect the visitor records: BT/ET, q/Q, cm, TL, Tf, Td/TD/Tm/T*, Tj/TJ/'/" and Do.
+    Every calculation is done the same way and in the same order as pypdf's, so the
+    records come out identical, down to the floats. What pypdf rebuilds for each page
+    (font maps) is kept for the whole book, where it looks at all the text extracted
+    so far only its last character is kept, and matrices are replaced rather than
+    changed in place, so they needn't be copied.
+    """
+
+    def __init__(self, page, font_cache: dict):
+        self.page = page
+        self.font_cache = font_cache
+        self.page_fonts = {}
+        self.records = []
+        self.cm = IDENTITY
+        self.tm = IDENTITY
+        self.cm_stack = []
+        self.cm_prev = IDENTITY
+        self.tm_prev = IDENTITY
+        self.memo_cm = IDENTITY
+        self.memo_tm = IDENTITY
+        self.space_width = 500.0
+        self.str_widths = 0.0
+        self.str_space_width = 0.0
+        self.str_height = 0.0
+        self.TL = 0.0
+        self.font_size = 12.0
+        self.text = ""
+        # Last character of everything flushed from text so far
+        self.output_end = ""
+        self.rtl_dir = False
+        # pypdf's stand-in until the first Tf
+        self.font = StreamFont("charmap", {}, None, self.space_width)
+        self.font_dict = None
+        self.operators = {
+            b"Tj": self.show_text,
+            b"TJ": self.show_text_array,
+            b"Td": self.move_text,
+            b"Tm": self.set_text_matrix,
+            b"Tf": self.set_font,
+            b"BT": self.begin_text,
+            b"ET": self.end_text,
+            b"T*": self.next_line,
+            b"TD": self.move_text_and_set_leading,
+            b"TL": self.set_leading,
+            b"q": self.save_state,
+            b"Q": self.restore_state,
+            b"cm": self.concat_matrix,
+            b"'": self.next_line_show_text,
+            b'"': self.next_line_show_spaced_text,
+            b"Do": self.draw_object,
+            b"BI": self.begin_inline_image,
+        }
+
+    def run(self) -> list[list]:
+        page = self.page
+        try:
+            resources_owner = page
+            while "/Resources" not in resources_owner:
+                resources_owner = resources_owner["/Parent"].get_object()
+            resources = resources_owner["/Resources"]
+        except Exception:
+            return []
+        from pypdf.generic import is_null_or_none
+        self.resource_fonts = None
+        if not is_null_or_none(resources) and "/Font" in resources and resources["/Font"]:
+            self.resource_fonts = resources["/Font"]
+        self.resources = resources
+        data = get_content_data(page)
+        if data is None:
+            return []
+        self.custom_rtl = has_custom_rtl()
+        operators = self.operators
+        operands = []
+        # Arrays and dictionaries being read, innermost last
+        containers = []
+        for match in TOKEN_PATTERN.finditer(data):
+            kind = match.lastgroup
+            token = match.group(kind)
+            if kind == "number":
+                value = float(token) if b"." in token else int(token)
+            elif kind == "operator":
+                if len(containers) > 0:
+                    if token not in KEYWORDS:
+                        raise UnsupportedContent(f"{token!r} in an array or dictionary")
+                    # In a tuple, so it isn't taken for a string
+                    value = (token,)
+                else:
+                    operator = operators.get(token)
+                    if operator is not None:
+                        operator(operands)
+                    operands = []
+                    continue
+            elif kind == "string":
+                value = token[1:-1]
+                if b"\\" in value:
+                    value = unescape(value)
+            elif kind == "name":
+                if b"#" in token:
+                    raise UnsupportedContent("escaped name")
+                value = token.decode("utf-8")
+            elif kind == "array" or kind == "dict":
+                containers.append([])
+                continue
+            elif kind == "array_end" or kind == "dict_end":
+                if len(containers) == 0:
+                    raise UnsupportedContent(f"unmatched {token!r}")
+                value = containers.pop()
+            elif kind == "hex":
+                digits = token[1:-1].translate(None, HEX_WHITESPACE)
+                if len(digits) % 2 == 1:
+                    digits += b"0"
+                value = bytes.fromhex(digits.decode("ascii"))
+            elif kind == "comment":
+                continue
+            else:
+                raise UnsupportedContent(f"unexpected {token!r}")
+            if len(containers) > 0:
+                containers[-1].append(value)
+            else:
+                operands.append(value)
+        if len(containers) > 0:
+            raise UnsupportedContent("unterminated array or dictionary")
+        if self.text != "":
+            self.visit(self.text, self.memo_cm, self.memo_tm)
+        return self.records
+
+    def visit(self, text: str, cm: list[float], tm: list[float]):
+        self.records.append([text, cm.copy(), tm.copy(), self.font_dict, self.font_size])
+
+    def flush(self):
+        """Hands the text extracted so far to the visitor and starts anew at the current position."""
+        if self.text != "":
+            self.output_end = self.text[-1]
+        self.visit(self.text, self.memo_cm, self.memo_tm)
+        self.text = ""
+        self.memo_cm = self.cm
+        self.memo_tm = self.tm
+
+    def begin_text(self, operands: list):
+        self.tm = IDENTITY
+        self.flush()
+
+    def end_text(self, operands: list):
+        self.flush()
+
+    def save_state(self, operands: list):
+        self.cm_stack.append((self.cm, self.font, self.font_dict, self.font_size, self.space_width, self.TL))
+
+    def restore_state(self, operands: list):
+        if len(self.cm_stack) > 0:
+            (self.cm, self.font, self.font_dict, self.font_size, self.space_width, self.TL) = self.cm_stack.pop()
+        else:
+            self.cm = IDENTITY
+
+    def concat_matrix(self, operands: list):
+        if self.text != "":
+            self.output_end = self.text[-1]
+        self.visit(self.text, self.memo_cm, self.memo_tm)
+        self.text = ""
+        try:
+            self.cm = mult([float(operand) for operand in operands[:6]], self.cm)
+        except Exception:
+            self.cm = IDENTITY
+        self.memo_cm = self.cm
+        self.memo_tm = self.tm
+
+    def set_font(self, operands: list):
+        if self.text != "":
+            self.output_end = self.text[-1]
+            self.visit(self.text, self.memo_cm, self.memo_tm)
+        self.text = ""
+        self.memo_cm = self.cm
+        self.memo_tm = self.tm
+        name = operands[0]
+        if name not in self.page_fonts:
+            if self.resource_fonts is not None and name in self.resource_fonts:
+                self.page_fonts[name] = load_font(self.page, name, self.font_cache)
+            else:
+                self.page_fonts[name] = (None, None)
+        (font_dict, font) = self.page_fonts[name]
+        if font is None:
+            (font_dict, font) = (None, get_unknown_font(self.font_cache))
+        self.font = font
+        self.font_dict = font_dict
+        self.space_width = font.space_width
+        try:
+            self.font_size = float(operands[1])
+        except Exception:
+            pass
+
+    def set_leading(self, operands: list):
+        scale_x = sqrt(self.tm[0] ** 2 + self.tm[2] ** 2)
+        self.TL = float(operands[0] if operands else 0.0) * self.font_size * scale_x
+
+    def set_text_matrix(self, operands: list):
+        self.tm = [float(operand) for operand in operands[:6]]
+        self.end_line()
+
+    def move_text(self, operands: list):
+        (tx, ty) = (float(operands[0]), float(operands[1]))
+        tm = self.tm
+        self.tm = [tm[0], tm[1], tm[2], tm[3], tm[4] + (tx * tm[0] + ty * tm[2]), tm[5] + (tx * tm[1] + ty * tm[3])]
+        self.end_line()
+
+    def move_text_and_set_leading(self, operands: list):
+        self.set_leading([-operands[1]])
+        self.move_text(operands)
+
+    def next_line(self, operands: list | None = None):
+        tm = self.tm
+        self.tm = [tm[0], tm[1], tm[2], tm[3], tm[4] - self.TL * tm[2], tm[5] - self.TL * tm[3]]
+        self.end_line()
+
+    def next_line_show_text(self, operands: list):
+        self.next_line()
+        self.show_text(operands)
+
+    def next_line_show_spaced_text(self, operands: list):
+        self.next_line()
+        self.show_text(operands[2:])
+
+    def show_text(self, operands: list):
+        self.show_string(operands[0] if len(operands) > 0 else None)
+
+    def end_line(self):
+        str_widths = self.str_widths / 1000
+        self.str_widths = 0.0
+        self.check_line_break(str_widths)
+
+    def show_text_array(self, operands: list):
+        # The space width may be smaller than the font width, so the width should be 95%.
+        confirm_space_width = self.space_width * 0.95
+        if operands:
+            for op in operands[0]:
+                if isinstance(op, (str, bytes)):
+                    self.show_string(op)
+                elif isinstance(op, (int, float)) and abs(float(op)) >= confirm_space_width \
+                        and self.text and self.text[-1] != " ":
+                    self.show_string(" ")
+
+    def show_string(self, operand: bytes | str | None):
+        font = self.font
+        # Widths are added up one character at a time, in the same order as pypdf does it,
+        # so the rounding comes out the same.
+        widths = 0
+        if operand is None:
+            pass
+        elif isinstance(operand, str):
+            self.text += operand
+            widths = reduce(add, map(font.widths.get, operand, repeat(font.default_width)), 0)
+        elif not isinstance(operand, bytes):
+            raise UnsupportedContent("text operand that isn't a string")
+        elif font.byte_text is not None:
+            if font.undecodable is not None and font.undecodable.search(operand) is not None:
+                raise UnsupportedContent("byte pypdf can't decode")
+            byte_text = font.byte_text
+            mapped = [byte_text[b] for b in operand]
+            mapped_text = "".join(mapped)
+            if self.rtl_dir or self.custom_rtl or RTL_PATTERN.search(mapped_text) is not None:
+                self.add_display_text(mapped)
+            else:
+                self.text += mapped_text
+            widths = reduce(add, map(font.byte_widths.__getitem__, operand), 0)
+        else:
+            encoding = font.encoding
+            if isinstance(encoding, dict):
+                text_operands = "".join([encoding[b] if b in encoding else bytes((b,)).decode() for b in operand])
+            else:
+                try:
+                    text_operands = operand.decode(encoding, "surrogatepass")
+                except Exception:
+                    text_operands = operand.decode("utf-16-be" if encoding == "charmap" else "charmap",
+                                                   "surrogatepass")
+            mapped_text = text_operands.translate(font.translation)
+            if self.rtl_dir or self.custom_rtl or RTL_PATTERN.search(mapped_text) is not None:
+                unicode_map = font.unicode_map
+                self.add_display_text([unicode_map.get(c, c) for c in text_operands])
+            else:
+                self.text += mapped_text
+            widths = reduce(add, map(font.widths.get, text_operands, repeat(font.default_width)), 0)
+        self.str_widths += widths * self.font_size
+        self.str_space_width = self.space_width * self.font_size
+        self.str_height = self.font_size
+        self.check_line_break(0.0)
+
+    def add_display_text(self, mapped: list[str]):
+        """
+        pypdf's get_display_str, for text with right-to-left characters in it: they're
+        written backwards, and the text so far is flushed when the direction changes.
+        """
+        from pypdf._text_extraction import CUSTOM_RTL_MIN, CUSTOM_RTL_MAX, CUSTOM_RTL_SPECIAL_CHARS
+        text = self.text
+        for x in mapped:
+            xx = ord(x) if len(x) == 1 else 1
+            if (xx <= 0x2F or 0x3A <= xx <= 0x40 or 0x2000 <= xx <= 0x206F or 0x20A0 <= xx <= 0x21FF
+                    or xx in CUSTOM_RTL_SPECIAL_CHARS):
+                text = x + text if self.rtl_dir else text + x
+            elif (0x0590 <= xx <= 0x08FF or 0xFB1D <= xx <= 0xFDFF or 0xFE70 <= xx <= 0xFEFF
+                  or CUSTOM_RTL_MIN <= xx <= CUSTOM_RTL_MAX):
+                if not self.rtl_dir:
+                    self.rtl_dir = True
+                    self.visit(text, self.cm, self.tm)
+                    text = ""
+                text = x + text
+            else:
+                if self.rtl_dir:
+                    self.rtl_dir = False
+                    self.visit(text, self.cm, self.tm)
+                    text = ""
+                text = text + x
+        self.text = text
+
+    def check_line_break(self, str_widths: float):
+        """
+        pypdf's crlf_space_check: ends the line if the text moved down, or adds a space if it
+        moved right. Only the parts of the matrix products it looks at are worked out.
+        """
+        cm = self.cm
+        tm = self.tm
+        text = self.text
+        last_char = text[-1] if text != "" else self.output_end
+        if last_char != "":
+            cm_prev = self.cm_prev
+            tm_prev = self.tm_prev
+            delta_x = (tm[4] * cm[0] + tm[5] * cm[2] + cm[4]) \
+                      - (tm_prev[4] * cm_prev[0] + tm_prev[5] * cm_prev[2] + cm_prev[4])
+            delta_y = (tm[4] * cm[1] + tm[5] * cm[3] + cm[5]) \
+                      - (tm_prev[4] * cm_prev[1] + tm_prev[5] * cm_prev[3] + cm_prev[5])
+            # Upright or upside down text moves down a line in y, sideways text in x.
+            m3 = tm[2] * cm[1] + tm[3] * cm[3]
+            if m3 > 1e-6 or m3 < -1e-6:
+                (moved_height, moved_width) = (delta_y, delta_x)
+            else:
+                (moved_height, moved_width) = (delta_x, delta_y)
+            scale_prev_y = sqrt(tm_prev[2]**2 + tm_prev[3]**2)
+            scale_y = sqrt(tm[2]**2 + tm[3]**2)
+            if abs(moved_height) > 0.8 * min(self.str_height * scale_prev_y, self.font_size * scale_y):
+                if last_char != "\n":
+                    self.output_end = "\n"
+                    self.visit(text + "\n", self.memo_cm, self.memo_tm)
+                    self.text = ""
+            elif moved_width >= (self.str_space_width / 1000 + str_widths) * sqrt(tm_prev[0]**2 + tm_prev[1]**2) \
+                    and last_char != " ":
+                self.text = text + " "
+        self.tm_prev = tm
+        self.cm_prev = cm
+        if self.text == "":
+            self.memo_cm = cm
+            self.memo_tm = tm
+
+    def draw_object(self, operands: list):
+        if self.text != "":
+            self.output_end = self.text[-1]
+        self.visit(self.text, self.memo_cm, self.memo_tm)
+        if self.output_end not in ("", "\n"):
+            self.output_end = "\n"
+            self.visit("\n", self.memo_cm, self.memo_tm)
+        try:
+            subtype = self.resources["/XObject"][operands[0]]["/Subtype"]
+        except Exception:
+            raise UnsupportedContent("missing XObject")
+        if subtype != "/Image":
+            raise UnsupportedContent("form XObject")
+        self.text = ""
+        self.memo_cm = self.cm
+        self.memo_tm = self.tm
+
+    def begin_inline_image(self, operands: list):
+        raise UnsupportedContent("inline image")
@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import bench
+import blurb_server
+import scrape
+
+
+class BlurbServerTest(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.previous_dir = os.getcwd()
+        cls.directory = tempfile.TemporaryDirectory()
+        os.chdir(cls.directory.name)
+        bench.write_json_stubs(".", bench.make_sourcebook(".", 40))
+        with contextlib.redirect_stdout(io.StringIO()):
+            cls.pdfs = scrape.find_pdfs()
+            cls.entries = list(scrape.get_entries(cls.pdfs))
+
+    @classmethod
+    def tearDownClass(cls):
+        scrape.readers.clear()
+        os.chdir(cls.previous_dir)
+        cls.directory.cleanup()
+
+    async def asyncSetUp(self):
+        self.executor = ThreadPoolExecutor(1)
+        self.server = blurb_server.BlurbServer(self.pdfs, self.entries, self.executor)
+        self.listener = await asyncio.start_server(self.server.handle_connection, "127.0.0.1", 0)
+        self.port = self.listener.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.listener.close()
+        await self.listener.wait_closed()
+        self.executor.shutdown()
+
+    async def get(self, path: str, **params) -> tuple[int, dict]:
+        (reader, writer) = await asyncio.open_connection("127.0.0.1", self.port)
+        target = path + ("?" + urlencode(params) if len(params) > 0 else "")
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode("latin-1"))
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        await writer.wait_closed()
+        (head, _, body) = response.partition(b"\r\n\r\n")
+        return (int(head.split()[1]), json.loads(body))
+
+    async def test_blurb(self):
+        entry = self.entries[0]
+        (status, blurb) = await self.get("/blurb", name = entry["name"])
+        self.assertEqual(status, 200)
+        self.assertEqual((blurb["name"], blurb["book"]), (entry["name"], entry["book"]))
+        self.assertGreater(len(blurb["text"]), 0)
+
+    async def test_unknown_entry(self):
+        (status, _) = await self.get("/blurb", name = "No Such Entry")
+        self.assertEqual(status, 404)
+
+    async def test_requests_on_one_window_share_its_condensing(self):
+        window = (self.entries[0]["page"], self.entries[0]["options"].get("beginning_properties", False))
+        names = [entry["name"] for entry in self.entries
+                 if (entry["page"], entry["options"].get("beginning_properties", False)) == window]
+        responses = await asyncio.gather(*[self.get("/blurb", name = name) for name in names * 3])
+        self.assertEqual([status for (status, _) in responses], [200] * len(names) * 3)
+        self.assertEqual(self.server.windows_condensed, 1)
+
+    async def test_metrics(self):
+        await self.get("/blurb", name = self.entries[0]["name"])
+        (status, metrics) = await self.get("/metrics")
+        self.assertEqual(status, 200)
+        self.assertEqual(metrics["latency"]["requests"], 1)
+        self.assertEqual(metrics["windows_cached"], 1)
+
+    async def test_page_must_be_a_number(self):
+        entry = self.entries[0]
+        for page in ["--5", "five", "5.0"]:
+            (status, body) = await self.get("/blurb", name = entry["name"], book = entry["book"], page = page)
+            self.assertEqual(status, 400, page)
+            self.assertEqual(body, {"error": "page must be a number"})
+
+
+if __name__ == "__main__":
+    unittest.main()
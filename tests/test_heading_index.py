@@ -0,0 +1,52 @@
+import unittest
+
+from heading_index import HeadingIndex
+
+
+class HeadingIndexTest(unittest.TestCase):
+
+    def make_index(self, headings):
+        index = HeadingIndex()
+        for (page_num, text) in headings:
+            index.add(page_num, text)
+        return index
+
+    def test_exact_match_anywhere_in_book(self):
+        index = self.make_index([(7, "Landslide Strike"), (90, "Landslide Strike")])
+        self.assertEqual(index.find("Landslide Strike", 80), (90, "Landslide Strike", "exact"))
+
+    def test_bracket_match(self):
+        index = self.make_index([(12, "Way of the Crab [Kata]")])
+        self.assertEqual(index.find("Way of the Crab", 40), (12, "Way of the Crab [Kata]", "bracket"))
+
+    def test_misspelling_near_page(self):
+        index = self.make_index([(30, "Elixir of Recovery"), (31, "Ikoma Bard School")])
+        self.assertEqual(index.find("Elxir of Recovery", 33), (30, "Elixir of Recovery", "edit_distance"))
+
+    def test_heading_starting_with_name_near_page(self):
+        index = self.make_index([(52, "Striking as Air (Kata)"), (53, "Striking as Fire (Kata)")])
+        self.assertEqual(index.find("Striking as Air", 50), (52, "Striking as Air (Kata)", "prefix"))
+
+    def test_heading_sharing_first_words_is_another_entry(self):
+        index = self.make_index([(7, "Jade Stone Distinction Iron"), (8, "Striking as Air")])
+        self.assertIsNone(index.find("Jade Stone Kata", 7))
+
+    def test_heading_starting_with_name_far_from_page_is_no_match(self):
+        index = self.make_index([(7, "Striking as Air (Kata)")])
+        self.assertIsNone(index.find("Striking as Air", 60))
+
+    def test_ambiguous_prefix_is_no_match(self):
+        index = self.make_index([(7, "Striking as Air (Kata)"), (8, "Striking as Air Stance")])
+        self.assertIsNone(index.find("Striking as Air", 7))
+
+    def test_misspelling_far_from_page_is_no_match(self):
+        index = self.make_index([(7, "Elixir of Recovery")])
+        self.assertIsNone(index.find("Elxir of Recovery", 60))
+
+    def test_ambiguous_misspelling_is_no_match(self):
+        index = self.make_index([(20, "Iron Mountain"), (21, "Iron Fountain")])
+        self.assertIsNone(index.find("Iron Xountain", 20))
+
+
+if __name__ == "__main__":
+    unittest.main()
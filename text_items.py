@@ -0,0 +1,75 @@
+from array import array
+
+# Font names by font ID, shared by every TextItems in the process. ID 0 is text without a font.
+font_names = [None]
+font_ids = {None: 0}
+
+
+def intern_font(name: str | None) -> int:
+    font_id = font_ids.get(name)
+    if font_id is None:
+        font_id = len(font_names)
+        font_names.append(name)
+        font_ids[name] = font_id
+    return font_id
+
+
+class TextItems:
+    """
+    Extracted runs of text in columns, keeping only what condense_text needs of each:
+    its text, its font name as an ID into font_names, and the x, y and horizontal scale
+    of its text matrix as floats. A page is a handful of arrays rather than a dozen
+    objects per run, and keeps no pypdf font objects alive. Font IDs are only meaningful
+    in the process that made them, so TextItems aren't passed between processes.
+    """
+    __slots__ = ("texts", "fonts", "xs", "ys", "scales")
+
+    def __init__(self):
+        self.texts = []
+        self.fonts = array("I")
+        self.xs = array("d")
+        self.ys = array("d")
+        self.scales = array("d")
+
+    @classmethod
+    def from_records(cls, records: list[list]) -> "TextItems":
+        """
+        Converts extractor records, [text, cm, tm, font, font size], where font is a font
+        dictionary, its /BaseFont name as the page cache stores it, or None.
+        """
+        items = cls()
+        font_ids_by_font = {}
+        for (text, _, tm, font, _) in records:
+            font_key = id(font)
+            font_id = font_ids_by_font.get(font_key)
+            if font_id is None:
+                if font is None or isinstance(font, str):
+                    font_id = intern_font(font)
+                else:
+                    font_id = intern_font(str(font.get('/BaseFont', '')))
+                font_ids_by_font[font_key] = font_id
+            items.texts.append(text)
+            items.fonts.append(font_id)
+            items.xs.append(tm[4])
+            items.ys.append(tm[5])
+            items.scales.append(tm[0])
+        return items
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __iadd__(self, other: "TextItems") -> "TextItems":
+        self.texts += other.texts
+        self.fonts += other.fonts
+        self.xs += other.xs
+        self.ys += other.ys
+        self.scales += other.scales
+        return self
+
+    def font_name(self, i: int) -> str | None:
+        return font_names[self.fonts[i]]
+
+    def rows(self) -> list[tuple[str, str | None, float, float, float]]:
+        """(text, font name, x, y, scale) of each run, for printing."""
+        return [(text, font_names[font_id], x, y, scale)
+                for (text, font_id, x, y, scale) in zip(self.texts, self.fonts, self.xs, self.ys, self.scales)]